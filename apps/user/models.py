@@ -66,3 +66,4 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         ordering = ("-date_joined",)
+        indexes = [models.Index(fields=["-date_joined"], name="user_date_joined_idx")]
@@ -0,0 +1,82 @@
+# exams/answer_keys.py
+"""
+编译后的答案表（answer key），评分时不再逐题查询选项：
+    {question_id: AnswerKey(type, marks, correct_ids, choice_ids)}
+
+两级缓存：进程内 LRU + Django cache，缓存键里带题库版本号
+（questions.versions），Question / Choice 的 save/delete 信号会 bump 版本，
+旧条目自然失效。
+"""
+import hashlib
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from django.core.cache import cache
+
+from questions.models import Question, Choice
+from questions.versions import get_version
+
+AnswerKey = namedtuple('AnswerKey', ['type', 'marks', 'correct_ids', 'choice_ids'])
+
+LRU_SIZE = 256
+CACHE_TIMEOUT = 60 * 60
+
+_lru = OrderedDict()  # set_key -> (version, {qid: AnswerKey})
+_lock = Lock()
+
+
+def question_set_key(question_ids):
+    raw = ','.join(str(i) for i in sorted(set(question_ids)))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def compile_answer_key(question_ids):
+    """两条 SQL 编译一组题目的答案表"""
+    correct = {}
+    choices = {}
+    for cid, qid, is_correct in (Choice.objects
+                                 .filter(question_id__in=question_ids)
+                                 .values_list('id', 'question_id', 'is_correct')):
+        choices.setdefault(qid, set()).add(cid)
+        if is_correct:
+            correct.setdefault(qid, set()).add(cid)
+
+    return {
+        qid: AnswerKey(
+            type=qtype,
+            marks=float(marks),
+            correct_ids=frozenset(correct.get(qid, ())),
+            choice_ids=frozenset(choices.get(qid, ())),
+        )
+        for qid, qtype, marks in (Question.objects
+                                  .filter(id__in=question_ids)
+                                  .values_list('id', 'type', 'marks'))
+    }
+
+
+def get_answer_key(question_ids):
+    """
+    取一组题目的答案表：先查进程内 LRU，再查 Django cache，都未命中才编译。
+    命中时不产生任何数据库查询。
+    """
+    version = get_version()
+    set_key = question_set_key(question_ids)
+
+    with _lock:
+        hit = _lru.get(set_key)
+        if hit is not None and hit[0] == version:
+            _lru.move_to_end(set_key)
+            return hit[1]
+
+    cache_key = f'answer_key:{version}:{set_key}'
+    answer_key = cache.get(cache_key)
+    if answer_key is None:
+        answer_key = compile_answer_key(question_ids)
+        cache.set(cache_key, answer_key, CACHE_TIMEOUT)
+
+    with _lock:
+        _lru[set_key] = (version, answer_key)
+        _lru.move_to_end(set_key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+    return answer_key
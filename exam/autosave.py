@@ -0,0 +1,144 @@
+# exams/autosave.py
+"""
+作答自动保存：前端每次点击都把答案发过来，但不直接写 AttemptAnswer。
+最新答案先合并进 Django cache 里的缓冲区（按 attempt_token），
+距上次落库超过 EXAM_AUTOSAVE_FLUSH_SECONDS 才写一次 Attempt.draft_answers；
+提交时缓冲区与已落库的草稿逐题取较新的一份，再与提交内容合并后交给
+SubmitExamSerializer 评分。
+
+缓冲区结构：
+    {"attempt_id": str, "question_ids": [int], "answers": {qid: item},
+     "flushed_at": float, "dirty": bool}
+每个 item 带 saved_at（暂存时间），缓冲区和草稿里都有，用来判断哪份更新。
+question_ids 是开考时冻结的题组：不在题组里的答案暂存时就拒绝，
+否则提交时会因为这份草稿一直被拒。
+读-改-写缓冲区时持有 cache.add 实现的锁，并发的两次暂存不会互相覆盖。
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Attempt
+
+BUFFER_TIMEOUT = 24 * 60 * 60
+LOCK_TIMEOUT = 10  # 持锁进程挂掉后锁自动过期
+LOCK_WAIT = 3
+
+
+class AutosaveBusy(Exception):
+    """等不到缓冲区的锁（另一请求正持有）"""
+
+
+class ForeignQuestions(Exception):
+    """答案里有不在本次作答冻结题组里的题目；args[0] 是这些题目 id"""
+
+
+def flush_interval():
+    return getattr(settings, 'EXAM_AUTOSAVE_FLUSH_SECONDS', 30)
+
+
+def buffer_key(attempt_token):
+    return f'autosave:{attempt_token}'
+
+
+def _normalize(answers):
+    """JSON 落库后 key 会变成字符串，这里统一成 int"""
+    return {int(qid): item for qid, item in (answers or {}).items()}
+
+
+@contextmanager
+def _locked(attempt_token, wait=LOCK_WAIT):
+    key = f'{buffer_key(attempt_token)}:lock'
+    deadline = time.monotonic() + wait
+    while not cache.add(key, 1, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise AutosaveBusy(attempt_token)
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def stage(attempt_token, items, now=None, wait=LOCK_WAIT):
+    """
+    合并一批答案到缓冲区；缓冲区不存在时才查一次库确认 attempt 可作答。
+    返回 (缓冲区, 本次是否落库)。attempt 不存在或已提交时抛 Attempt.DoesNotExist，
+    有题目不在冻结题组里时整批不暂存、抛 ForeignQuestions，等锁超时抛 AutosaveBusy。
+    """
+    now = now or time.time()
+    with _locked(attempt_token, wait):
+        return _stage(attempt_token, items, now)
+
+
+def _stage(attempt_token, items, now):
+    key = buffer_key(attempt_token)
+    buf = cache.get(key)
+    if buf is None:
+        attempt = (Attempt.objects
+                   .only('id', 'question_ids', 'draft_answers')
+                   .get(attempt_token=attempt_token, submitted_at__isnull=True))
+        buf = {
+            'attempt_id': str(attempt.id),
+            'question_ids': attempt.question_ids,
+            'answers': _normalize(attempt.draft_answers),
+            'flushed_at': now,
+            'dirty': False,
+        }
+
+    # 旧数据没有冻结题组则不校验
+    if buf.get('question_ids'):
+        foreign = sorted({item['question_id'] for item in items} - set(buf['question_ids']))
+        if foreign:
+            raise ForeignQuestions(foreign)
+
+    for item in items:
+        buf['answers'][item['question_id']] = dict(item, saved_at=now)
+    buf['dirty'] = True
+
+    flushed = False
+    if now - buf['flushed_at'] >= flush_interval():
+        flushed = flush(buf, now)
+    cache.set(key, buf, BUFFER_TIMEOUT)
+    return buf, flushed
+
+
+def flush(buf, now=None):
+    """把缓冲区写回 Attempt.draft_answers（已提交的 attempt 不会被覆盖）"""
+    if not buf['dirty']:
+        return False
+    Attempt.objects.filter(id=buf['attempt_id'], submitted_at__isnull=True).update(
+        draft_answers=buf['answers']
+    )
+    buf['flushed_at'] = now or time.time()
+    buf['dirty'] = False
+    return True
+
+
+def staged_answers(attempt):
+    """提交时取已暂存的答案：缓冲区和已落库的草稿逐题取 saved_at 较新的一份"""
+    staged = _normalize(attempt.draft_answers)
+    buf = cache.get(buffer_key(attempt.attempt_token))
+    if buf is not None:
+        for qid, item in buf['answers'].items():
+            current = staged.get(qid)
+            if current is None or item.get('saved_at', 0) >= current.get('saved_at', 0):
+                staged[qid] = item
+    return {
+        qid: {k: v for k, v in item.items() if k != 'saved_at'}
+        for qid, item in staged.items()
+    }
+
+
+def merge(staged, answers_payload):
+    """暂存答案 + 提交里显式带的答案（后者覆盖前者），按题目 id 排序"""
+    merged = dict(staged)
+    for item in answers_payload or []:
+        merged[item['question_id']] = item
+    return [merged[qid] for qid in sorted(merged)]
+
+
+def discard(attempt_tokens):
+    cache.delete_many([buffer_key(t) for t in attempt_tokens])
@@ -0,0 +1,111 @@
+# exams/grading.py
+"""
+批量（向量化）评分：用于答案更正后的整卷重评、以及一次性导入大量答题卡。
+
+每道题的选项按 id 排序后映射到一个 uint64 的比特位，
+正确答案 = 正确选项比特的 OR；每条作答同样编码成比特掩码，
+然后用 NumPy 一次算完整批作答，规则与 SubmitExamSerializer._score_one 一致：
+- Single Choice：恰好选了 1 个，且该选项正确
+- Multiple Choice：所选集合 == 正确集合（含不属于该题的选项即判错）
+- 其他题型：不得分
+"""
+import numpy as np
+
+TYPE_OTHER = 0
+TYPE_SINGLE = 1
+TYPE_MULTI = 2
+
+TYPE_CODES = {
+    'Single Choice': TYPE_SINGLE,
+    'Multiple Choice': TYPE_MULTI,
+}
+
+MAX_CHOICES = 64
+
+
+class EncodedKey:
+    """把 {qid: AnswerKey} 编码成按题目下标对齐的 NumPy 数组"""
+
+    def __init__(self, answer_key):
+        self.question_ids = sorted(answer_key)
+        self.index = {qid: i for i, qid in enumerate(self.question_ids)}
+        n = len(self.question_ids)
+
+        self.correct_mask = np.zeros(n, dtype=np.uint64)
+        self.marks = np.zeros(n, dtype=np.float64)
+        self.type_code = np.zeros(n, dtype=np.int8)
+        self.choice_bit = {}  # cid -> (题目下标, 比特)
+
+        for i, qid in enumerate(self.question_ids):
+            key = answer_key[qid]
+            choice_ids = sorted(key.choice_ids)
+            if len(choice_ids) > MAX_CHOICES:
+                raise ValueError(f'Question {qid} has more than {MAX_CHOICES} choices.')
+            mask = 0
+            for bit_no, cid in enumerate(choice_ids):
+                bit = 1 << bit_no
+                self.choice_bit[cid] = (i, bit)
+                if cid in key.correct_ids:
+                    mask |= bit
+            self.correct_mask[i] = mask
+            self.marks[i] = key.marks
+            self.type_code[i] = TYPE_CODES.get(key.type, TYPE_OTHER)
+
+
+class EncodedResponses:
+    """一批作答：第 k 行 = (题目下标, 所选掩码, 所选个数, 是否含非本题选项)"""
+
+    def __init__(self, encoded_key, rows):
+        q_idx, sel_mask, n_sel, foreign = [], [], [], []
+        index = encoded_key.index
+        choice_bit = encoded_key.choice_bit
+
+        for qid, selected in rows:
+            i = index[qid]
+            selected = selected or []
+            mask = 0
+            has_foreign = False
+            for cid in selected:
+                hit = choice_bit.get(cid)
+                if hit is None or hit[0] != i:
+                    has_foreign = True
+                else:
+                    mask |= hit[1]
+            q_idx.append(i)
+            sel_mask.append(mask)
+            n_sel.append(len(selected))
+            foreign.append(has_foreign)
+
+        self.q_idx = np.array(q_idx, dtype=np.int64)
+        self.sel_mask = np.array(sel_mask, dtype=np.uint64)
+        self.n_sel = np.array(n_sel, dtype=np.int64)
+        self.foreign = np.array(foreign, dtype=bool)
+
+
+def grade(encoded_key, responses):
+    """
+    一次向量化计算整批作答。
+    返回 (is_correct: bool[], marks_awarded: float[], question_marks: float[])
+    """
+    q = responses.q_idx
+    correct = encoded_key.correct_mask[q]
+    qtype = encoded_key.type_code[q]
+    marks = encoded_key.marks[q]
+
+    single_ok = (responses.n_sel == 1) & ((responses.sel_mask & correct) != 0)
+    multi_ok = ~responses.foreign & (responses.sel_mask == correct)
+    ok = np.where(qtype == TYPE_SINGLE, single_ok,
+                  np.where(qtype == TYPE_MULTI, multi_ok, False))
+    awarded = np.where(ok, marks, 0.0)
+    return ok, awarded, marks
+
+
+def totals_by_group(group_ids, awarded, question_marks):
+    """按 attempt 汇总：返回 {group_id: (score, total_marks)}"""
+    groups, inverse = np.unique(np.asarray(group_ids), return_inverse=True)
+    score = np.bincount(inverse, weights=awarded, minlength=len(groups))
+    total = np.bincount(inverse, weights=question_marks, minlength=len(groups))
+    return {
+        g: (float(s), float(t))
+        for g, s, t in zip(groups.tolist(), score.tolist(), total.tolist())
+    }
@@ -0,0 +1,67 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from exam.answer_keys import AnswerKey
+from exam.grading import EncodedKey, EncodedResponses, grade
+from exam.serializers import SubmitExamSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the vectorized batch grader against the per-row "
+        "SubmitExamSerializer._score_one path on a synthetic cohort (no database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=60)
+        parser.add_argument("--choices", type=int, default=4)
+        parser.add_argument("--responses", type=int, default=100_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        n_choices = options["choices"]
+
+        answer_key = {}
+        for qid in range(1, options["questions"] + 1):
+            choice_ids = [qid * 1000 + c for c in range(n_choices)]
+            if rng.random() < 0.5:
+                qtype, correct = "Single Choice", {rng.choice(choice_ids)}
+            else:
+                qtype, correct = "Multiple Choice", set(rng.sample(choice_ids, rng.randint(1, n_choices)))
+            answer_key[qid] = AnswerKey(qtype, float(rng.randint(1, 5)), frozenset(correct), frozenset(choice_ids))
+
+        qids = list(answer_key)
+        rows = []
+        for _ in range(options["responses"]):
+            qid = rng.choice(qids)
+            choice_ids = sorted(answer_key[qid].choice_ids)
+            rows.append((qid, rng.sample(choice_ids, rng.randint(0, 2))))
+
+        scorer = SubmitExamSerializer()
+        t0 = time.perf_counter()
+        expected = [scorer._score_one(answer_key[qid], sel, "") for qid, sel in rows]
+        t_rows = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        encoded = EncodedKey(answer_key)
+        responses = EncodedResponses(encoded, rows)
+        t_encode = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        ok, awarded, _ = grade(encoded, responses)
+        t_grade = time.perf_counter() - t0
+
+        mismatches = int(
+            np.count_nonzero(ok != np.array([e[0] for e in expected], dtype=bool))
+            + np.count_nonzero(awarded != np.array([e[1] for e in expected]))
+        )
+
+        n = len(rows)
+        self.stdout.write(f"responses:            {n}")
+        self.stdout.write(f"per-row _score_one:   {t_rows * 1000:.1f} ms ({n / t_rows:,.0f}/s)")
+        self.stdout.write(f"vectorized encode:    {t_encode * 1000:.1f} ms")
+        self.stdout.write(f"vectorized grade:     {t_grade * 1000:.1f} ms ({n / max(t_grade, 1e-9):,.0f}/s)")
+        self.stdout.write(f"mismatches:           {mismatches}")
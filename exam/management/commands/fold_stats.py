@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam.models import StatEvent
+
+
+class Command(BaseCommand):
+    help = "Fold pending StatEvent rows (submission outbox) into QuestionStat / ChoiceStat."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and poll for new events every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total = 0
+        while True:
+            folded = StatEvent.fold_pending(batch_size=batch_size)
+            total += folded
+            if folded:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(f"Folded {total} stat events")
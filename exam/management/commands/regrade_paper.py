@@ -0,0 +1,106 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from exam.answer_keys import compile_answer_key
+from exam.grading import EncodedKey, EncodedResponses, grade, totals_by_group
+from exam.models import Attempt, AttemptAnswer, ChoiceStat, QuestionStat, StatEvent
+from testpaper.models import TestPaper
+
+
+class Command(BaseCommand):
+    help = (
+        "Regrade every AttemptAnswer of a TestPaper against the current answer key "
+        "in one vectorized pass, then recompute Attempt.score / total_marks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paper_id", type=int)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Grade and report, but write nothing."
+        )
+
+    def handle(self, *args, **options):
+        paper_id = options["paper_id"]
+        batch_size = options["batch_size"]
+        if not TestPaper.objects.filter(id=paper_id).exists():
+            raise CommandError(f"TestPaper {paper_id} not found")
+
+        rows = list(
+            AttemptAnswer.objects.filter(attempt__paper_id=paper_id).values_list(
+                "id", "attempt_id", "question_id", "selected_choice_ids", "is_correct", "marks_awarded"
+            )
+        )
+        if not rows:
+            self.stdout.write("No answers to regrade")
+            return
+
+        ids, attempt_ids, question_ids, selected, old_ok, old_marks = zip(*rows)
+        encoded = EncodedKey(compile_answer_key(set(question_ids)))
+        responses = EncodedResponses(encoded, zip(question_ids, selected))
+        ok, awarded, question_marks = grade(encoded, responses)
+
+        changed = np.flatnonzero(
+            (ok != np.array(old_ok, dtype=bool)) | (awarded != np.array(old_marks, dtype=np.float64))
+        )
+        answers = [
+            AttemptAnswer(id=ids[k], is_correct=bool(ok[k]), marks_awarded=float(awarded[k]))
+            for k in changed.tolist()
+        ]
+
+        totals = totals_by_group(attempt_ids, awarded, question_marks)
+        attempts = [
+            Attempt(id=aid, score=totals[aid][0], total_marks=totals[aid][1])
+            for aid, score, total in Attempt.objects.filter(id__in=totals).values_list(
+                "id", "score", "total_marks"
+            )
+            if (score, total) != totals[aid]
+        ]
+
+        # 题目维度统计：只有对错翻转的作答才修正正确/错误数（attempts 不变），
+        # 只改了得分（如分值调整）的作答不动统计
+        flipped = np.flatnonzero(ok != np.array(old_ok, dtype=bool))
+        stat_delta = {}
+        for k in flipped.tolist():
+            qid = question_ids[k]
+            d = 1 if ok[k] else -1
+            _, correct, wrong = stat_delta.get(qid, (0, 0, 0))
+            stat_delta[qid] = (0, correct + d, wrong - d)
+        stat_delta = {qid: delta for qid, delta in stat_delta.items() if delta != (0, 0, 0)}
+
+        if not options["dry_run"]:
+            with transaction.atomic():
+                # 先折叠未处理的 outbox，保证统计表已包含这些作答再做修正
+                while StatEvent.fold_pending(batch_size=batch_size):
+                    pass
+                AttemptAnswer.objects.bulk_update(
+                    answers, ["is_correct", "marks_awarded"], batch_size=batch_size
+                )
+                Attempt.objects.bulk_update(
+                    attempts, ["score", "total_marks"], batch_size=batch_size
+                )
+                QuestionStat.bulk_bump(stat_delta)
+                choice_stats = self.fix_wrong_selected(set(question_ids))
+        else:
+            choice_stats = 0
+
+        self.stdout.write(
+            f"Regraded {len(rows)} answers: {len(answers)} answers, "
+            f"{len(attempts)} attempts and {choice_stats} choice stats changed"
+            + (" (dry run)" if options["dry_run"] else "")
+        )
+
+    def fix_wrong_selected(self, question_ids):
+        """
+        wrong_selected_count 是“该选项为错误选项时被选的次数”。答案改过之后按当前答案重算：
+        错误选项的每次被选都算误选（= selected_count），正确选项为 0。返回改动的行数。
+        """
+        stats = ChoiceStat.objects.filter(choice__question_id__in=question_ids)
+        return (
+            stats.filter(choice__is_correct=True).exclude(wrong_selected_count=0)
+            .update(wrong_selected_count=0)
+            + stats.filter(choice__is_correct=False).exclude(wrong_selected_count=F("selected_count"))
+            .update(wrong_selected_count=F("selected_count"))
+        )
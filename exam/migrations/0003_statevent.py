@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0002_alter_attempt_student_delete_student'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stat_event', to='exam.attempt')),
+            ],
+        ),
+    ]
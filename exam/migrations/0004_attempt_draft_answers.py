@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0003_statevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='draft_answers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0004_attempt_draft_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='question_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,11 +1,12 @@
 # exams/models.py
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.db.models import F
 import uuid
 from students.models import Student
 from testpaper.models import TestPaper
 from questions.models import Question, Choice
+from questions.versions import QUESTION_STATS, bump_after_commit
 
 
 
@@ -26,6 +27,10 @@ class Attempt(models.Model):
     user_agent = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     meta = models.JSONField(default=dict, blank=True)
+    # 开考时冻结的题目 id（按出题顺序），提交只接受这些题目
+    question_ids = models.JSONField(default=list, blank=True)
+    # 自动保存的草稿 {question_id: answer item}，由 exam.autosave 定期落库
+    draft_answers = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f'Attempt {self.id} of {self.student} on {self.paper}'
@@ -58,6 +63,30 @@ class QuestionStat(models.Model):
         self.save(update_fields=['attempts_count', 'correct_count', 'wrong_count'])
         self.refresh_from_db()
 
+    @classmethod
+    def bulk_bump(cls, deltas):
+        """
+        批量累加，语句条数与题目数无关：
+        deltas = {question_id: (attempts, correct, wrong)}
+        先一次 bulk_create 补齐缺失行，再按相同增量分组，每组一条 UPDATE
+        """
+        if not deltas:
+            return
+        cls.objects.bulk_create(
+            [cls(question_id=qid) for qid in deltas], ignore_conflicts=True
+        )
+        groups = {}
+        for qid, delta in deltas.items():
+            groups.setdefault(tuple(delta), []).append(qid)
+        for (attempts, correct, wrong), qids in groups.items():
+            cls.objects.filter(question_id__in=qids).update(
+                attempts_count=F('attempts_count') + attempts,
+                correct_count=F('correct_count') + correct,
+                wrong_count=F('wrong_count') + wrong,
+            )
+        # 题目列表里的 accuracy 来自这里，让 /questions/ 的 ETag 失效
+        bump_after_commit(QUESTION_STATS)
+
 class ChoiceStat(models.Model):
     """
     选项维度的累计：
@@ -74,3 +103,69 @@ class ChoiceStat(models.Model):
             self.wrong_selected_count = F('wrong_selected_count') + 1
         self.save(update_fields=['selected_count', 'wrong_selected_count'])
         self.refresh_from_db()
+
+    @classmethod
+    def bulk_bump(cls, deltas):
+        """
+        批量累加：deltas = {choice_id: (selected, wrong_selected)}
+        与 QuestionStat.bulk_bump 相同：补齐缺失行 + 按增量分组 UPDATE
+        """
+        if not deltas:
+            return
+        cls.objects.bulk_create(
+            [cls(choice_id=cid) for cid in deltas], ignore_conflicts=True
+        )
+        groups = {}
+        for cid, delta in deltas.items():
+            groups.setdefault(tuple(delta), []).append(cid)
+        for (selected, wrong), cids in groups.items():
+            cls.objects.filter(choice_id__in=cids).update(
+                selected_count=F('selected_count') + selected,
+                wrong_selected_count=F('wrong_selected_count') + wrong,
+            )
+
+
+class StatEvent(models.Model):
+    """
+    统计 outbox：提交时与 Attempt/AttemptAnswer 同一事务写入一条，
+    再由 `python manage.py fold_stats` 批量折叠进 QuestionStat / ChoiceStat。
+    payload = {"q": [[question_id, is_correct], ...],
+               "c": [[choice_id, selected, wrong_selected], ...]}
+    """
+    attempt = models.OneToOneField(Attempt, on_delete=models.CASCADE, related_name='stat_event')
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def fold_pending(cls, batch_size=1000):
+        """
+        取最早的一批事件，合并增量写入统计表，并在同一事务里删除这些事件。
+        事务整体提交或整体回滚，worker 中途重启不会重复计数。返回处理的事件数。
+        """
+        with transaction.atomic():
+            events = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', 'payload')[:batch_size]
+            )
+            if not events:
+                return 0
+
+            q_delta = {}  # qid -> (attempts, correct, wrong)
+            c_delta = {}  # cid -> (sel, wrong)
+            for _, payload in events:
+                for qid, ok in payload.get('q', []):
+                    attempts, correct, wrong = q_delta.get(qid, (0, 0, 0))
+                    q_delta[qid] = (attempts + 1, correct + (1 if ok else 0), wrong + (0 if ok else 1))
+                for cid, sel, wrong in payload.get('c', []):
+                    sel_n, wrong_n = c_delta.get(cid, (0, 0))
+                    c_delta[cid] = (sel_n + sel, wrong_n + wrong)
+
+            # 提交后被删掉的题目/选项直接丢弃，避免外键错误卡住整批
+            live_q = set(Question.objects.filter(id__in=q_delta).values_list('id', flat=True))
+            live_c = set(Choice.objects.filter(id__in=c_delta).values_list('id', flat=True))
+            QuestionStat.bulk_bump({k: v for k, v in q_delta.items() if k in live_q})
+            ChoiceStat.bulk_bump({k: v for k, v in c_delta.items() if k in live_c})
+
+            cls.objects.filter(id__in=[eid for eid, _ in events]).delete()
+        return len(events)
@@ -3,9 +3,12 @@ from rest_framework import serializers
 from django.utils import timezone
 from django.db import transaction
 
-from .models import Student, Attempt, AttemptAnswer, QuestionStat, ChoiceStat
-from testpaper.models import TestPaper
-from questions.models import Question, Choice
+from .models import Student, Attempt, AttemptAnswer, StatEvent
+from .answer_keys import AnswerKey, get_answer_key
+from . import autosave
+from testpaper.cache import paper_exists, paper_spec
+from testpaper.generation import select_question_ids
+from testpaper.variants import take_variant
 
 class StudentInlineSerializer(serializers.Serializer):
     name = serializers.CharField()
@@ -17,26 +20,53 @@ class StartExamSerializer(serializers.Serializer):
     student = StudentInlineSerializer()
     started_at = serializers.DateTimeField(required=False)
 
+    def validate_paper_id(self, value):
+        if not paper_exists(value):
+            raise serializers.ValidationError('TestPaper not found.')
+        return value
+
+    def validate(self, attrs):
+        spec = paper_spec(attrs['paper_id'])
+        # 已发布的随机卷优先从预生成池里取一份（含渲染好的题目 JSON）
+        if spec.get('status') == 'Published' and spec['level_config']:
+            variant = take_variant(attrs['paper_id'], spec['level_config'])
+            if variant is not None:
+                attrs['question_ids'] = variant['question_ids']
+                attrs['rendered_questions'] = variant['questions']
+                return attrs
+
+        # 否则现场抽题并冻结到本次作答
+        question_ids, errors = select_question_ids(spec)
+        if errors:
+            raise serializers.ValidationError({'paper_id': errors})
+        attrs['question_ids'] = question_ids
+        return attrs
+
     def create(self, validated_data):
+        """
+        开考只写两条语句：学生 upsert + attempt insert（中间按学号取一次学生 id）。
+        user_agent / ip_address 由视图通过 save(**kwargs) 传入，
+        抽好的题目 id 冻结在 attempt.question_ids，都随 insert 一起写。
+        """
         s = validated_data['student']
-        student, _ = Student.objects.get_or_create(
-            student_no=s['student_no'],
-            defaults={'name': s['name'], 'email': s.get('email') or ''}
+        # 不存在则插入；存在则更新姓名（邮箱仅在提供时更新）
+        update_fields = ['name', 'email'] if s.get('email') else ['name']
+        Student.objects.bulk_create(
+            [Student(student_no=s['student_no'], name=s['name'], email=s.get('email') or '')],
+            update_conflicts=True,
+            unique_fields=['student_no'],
+            update_fields=update_fields,
         )
-        dirty = False
-        if student.name != s['name']:
-            student.name = s['name']; dirty = True
-        if s.get('email') and student.email != s.get('email'):
-            student.email = s['email']; dirty = True
-        if dirty: student.save()
-
-        paper = TestPaper.objects.get(id=validated_data['paper_id'])
-        started_at = validated_data.get('started_at') or timezone.now()
+        # UUID 主键在客户端生成，upsert 命中已有学生时不会带回库里的 id，单独取一次
+        student_id = Student.objects.values_list('id', flat=True).get(student_no=s['student_no'])
 
         attempt = Attempt.objects.create(
-            paper=paper,
-            student=student,
-            started_at=started_at,
+            paper_id=validated_data['paper_id'],
+            student_id=student_id,
+            started_at=validated_data.get('started_at') or timezone.now(),
+            user_agent=validated_data.get('user_agent', ''),
+            ip_address=validated_data.get('ip_address'),
+            question_ids=validated_data['question_ids'],
         )
         return attempt
 
@@ -48,31 +78,127 @@ class SubmitAnswerItemSerializer(serializers.Serializer):
     text_answer = serializers.CharField(required=False, allow_blank=True)
     time_spent = serializers.IntegerField(required=False, default=0)
 
+class AutosaveSerializer(serializers.Serializer):
+    attempt_token = serializers.UUIDField()
+    answers = SubmitAnswerItemSerializer(many=True)
+
+    def validate_answers(self, answers):
+        q_ids = [a['question_id'] for a in answers]
+        unknown = sorted(set(q_ids) - set(get_answer_key(q_ids)))
+        if unknown:
+            raise serializers.ValidationError(f'Unknown question ids: {unknown}')
+        return answers
+
 class SubmitExamSerializer(serializers.Serializer):
     attempt_token = serializers.UUIDField()
     submitted_at = serializers.DateTimeField(required=False)
     duration_seconds = serializers.IntegerField(required=False)
-    answers = SubmitAnswerItemSerializer(many=True)
+    # 可省略：未带的题目使用自动保存暂存的答案（见 exam.autosave）
+    answers = SubmitAnswerItemSerializer(many=True, required=False)
 
-    def _score_one(self, question: Question, selected_choice_ids, text_answer):
-        qtype = question.type
-        correct_ids = set(question.choices.filter(is_correct=True).values_list('id', flat=True))
+    def validate_answers(self, answers):
+        q_ids = [a['question_id'] for a in answers]
+        if len(q_ids) != len(set(q_ids)):
+            raise serializers.ValidationError('Each question may only be answered once.')
+        return answers
+
+    def _score_one(self, key: AnswerKey, selected_choice_ids, text_answer):
+        qtype = key.type
+        correct_ids = key.correct_ids
 
         if qtype == 'Single Choice':
             sel = list(selected_choice_ids or [])
             ok = (len(sel) == 1 and sel[0] in correct_ids)
-            return ok, (float(question.marks) if ok else 0.0)
+            return ok, (key.marks if ok else 0.0)
 
         if qtype == 'Multiple Choice':
             sel = set(selected_choice_ids or [])
             ok = (sel == correct_ids)
-            return ok, (float(question.marks) if ok else 0.0)
+            return ok, (key.marks if ok else 0.0)
 
         return False, 0.0
 
-    def create(self, validated_data):
-        from django.db.models import Sum, F
+    def _foreign_question_ids(self, attempt, answers_payload):
+        """不在开考时冻结的题目列表里的 question_id（旧数据没有冻结列表则不校验）"""
+        if not attempt.question_ids:
+            return []
+        allowed = set(attempt.question_ids)
+        return sorted({a['question_id'] for a in answers_payload} - allowed)
+
+    def _known_answers(self, attempt, answers_payload, answer_key):
+        """
+        去掉答案表里查不到的题目，返回 (剩下的答案, 未知题目 id)。
+        有冻结题组时查不到的只能是开考后被删掉的题，忽略即可，不能让学生永远交不了卷；
+        旧数据没有冻结题组，查不到就是未知题目
+        """
+        known = [a for a in answers_payload if a['question_id'] in answer_key]
+        if attempt.question_ids:
+            return known, []
+        return known, sorted({a['question_id'] for a in answers_payload} - set(answer_key))
 
+    def _grade(self, attempt, answers_payload, answer_key, submitted_at):
+        """
+        给一次作答评分：填好 attempt 的汇总字段，返回 (AttemptAnswer 列表, StatEvent)，
+        由调用方负责写库（单条提交 / 批量提交共用）
+        """
+        total_marks = 0.0
+        score = 0.0
+        aa_bulk = []
+
+        # 先在内存里聚合题目/选项的增量，最后作为一条 outbox 事件写入
+        per_question_delta = {}  # qid -> is_correct
+        per_choice_delta = {}  # cid -> (sel, wrong)
+        def bump_choice(cid, is_wrong):
+            sel_n, wrong_n = per_choice_delta.get(cid, (0, 0))
+            per_choice_delta[cid] = (sel_n + 1, wrong_n + (1 if is_wrong else 0))
+
+        for item in answers_payload:
+            qid = item['question_id']
+            key = answer_key[qid]
+            total_marks += key.marks
+
+            sel = item.get('selected_choice_ids') or []
+            txt = item.get('text_answer', '')
+            tsec = int(item.get('time_spent') or 0)
+
+            ok, got = self._score_one(key, sel, txt)
+            score += got
+
+            # 记录 AttemptAnswer
+            aa_bulk.append(AttemptAnswer(
+                attempt=attempt,
+                question_id=qid,
+                selected_choice_ids=list(sel),
+                text_answer=txt,
+                is_correct=ok,
+                marks_awarded=got,
+                time_spent=tsec
+            ))
+
+            # 题目维度聚合
+            per_question_delta[qid] = ok
+
+            # 选项维度聚合（特别是错误选项）；忽略不属于该题的选项 id
+            for cid in sel:
+                if cid not in key.choice_ids:
+                    continue
+                bump_choice(cid, cid not in key.correct_ids)
+
+        # 更新 Attempt 汇总
+        attempt.total_marks = total_marks
+        attempt.score = score
+        attempt.submitted_at = submitted_at
+        # 考点离线上传的 submitted_at 来自客户端时钟，可能早于 started_at；时长不能为负
+        attempt.duration_seconds = max(0, int((attempt.submitted_at - attempt.started_at).total_seconds()))
+
+        # 题目/选项维度增量写入 outbox，由 fold_stats 异步折叠进统计表
+        event = StatEvent(attempt=attempt, payload={
+            'q': [[qid, ok] for qid, ok in per_question_delta.items()],
+            'c': [[cid, sel_n, wrong_n] for cid, (sel_n, wrong_n) in per_choice_delta.items()],
+        })
+        return aa_bulk, event
+
+    def create(self, validated_data):
         with transaction.atomic():
             attempt = Attempt.objects.select_for_update().get(
                 attempt_token=validated_data['attempt_token']
@@ -80,78 +206,121 @@ class SubmitExamSerializer(serializers.Serializer):
             if attempt.submitted_at:
                 raise serializers.ValidationError('This attempt was already submitted.')
 
+            # 自动保存的暂存答案 + 本次提交带的答案
+            answers_payload = autosave.merge(
+                autosave.staged_answers(attempt), validated_data.get('answers')
+            )
+
+            foreign = self._foreign_question_ids(attempt, answers_payload)
+            if foreign:
+                raise serializers.ValidationError(
+                    {'answers': f'Questions not part of this attempt: {foreign}'}
+                )
+
+            # 编译好的答案表 {qid: AnswerKey}，缓存命中时不查库；有冻结题组时按题组取
+            q_ids = attempt.question_ids or [a['question_id'] for a in answers_payload]
+            answer_key = get_answer_key(q_ids)
+            answers_payload, unknown = self._known_answers(attempt, answers_payload, answer_key)
+            if unknown:
+                raise serializers.ValidationError({'answers': f'Unknown question ids: {unknown}'})
+
             submitted_at = validated_data.get('submitted_at') or timezone.now()
-            answers_payload = validated_data['answers']
-
-            # 预取题与选项 -> {qid: Question}, {cid: is_correct}
-            q_ids = [a['question_id'] for a in answers_payload]
-            questions = list(Question.objects.filter(id__in=q_ids).prefetch_related('choices'))
-            qmap = {q.id: q for q in questions}
-            choice_is_correct = {}
-            for q in questions:
-                for c in q.choices.all():
-                    choice_is_correct[c.id] = c.is_correct
-
-            total_marks = 0.0
-            score = 0.0
-            aa_bulk = []
-
-            # 先把所有被点击的选项聚合计数（减少 DB 调用）
-            per_choice_delta = {}  # cid -> {'sel': n, 'wrong': n}
-            def bump_choice(cid, is_wrong):
-                d = per_choice_delta.setdefault(cid, {'sel':0, 'wrong':0})
-                d['sel'] += 1
-                if is_wrong:
-                    d['wrong'] += 1
-
-            for item in answers_payload:
-                q = qmap[item['question_id']]
-                total_marks += float(q.marks)
-
-                sel = item.get('selected_choice_ids') or []
-                txt = item.get('text_answer', '')
-                tsec = int(item.get('time_spent') or 0)
-
-                ok, got = self._score_one(q, sel, txt)
-                score += got
-
-                # 记录 AttemptAnswer
-                aa_bulk.append(AttemptAnswer(
-                    attempt=attempt,
-                    question=q,
-                    selected_choice_ids=list(sel),
-                    text_answer=txt,
-                    is_correct=ok,
-                    marks_awarded=got,
-                    time_spent=tsec
-                ))
-
-                # 选项维度聚合（特别是错误选项）
-                for cid in sel:
-                    is_wrong_choice = not choice_is_correct.get(cid, False)
-                    bump_choice(cid, is_wrong_choice)
+            aa_bulk, event = self._grade(attempt, answers_payload, answer_key, submitted_at)
 
             AttemptAnswer.objects.bulk_create(aa_bulk)
-
-            # 更新 Attempt 汇总
-            attempt.total_marks = total_marks
-            attempt.score = score
-            attempt.submitted_at = submitted_at
-            attempt.duration_seconds = int((attempt.submitted_at - attempt.started_at).total_seconds())
             attempt.save(update_fields=['total_marks', 'score', 'submitted_at', 'duration_seconds'])
+            event.save()
+            transaction.on_commit(lambda: autosave.discard([attempt.attempt_token]))
+
+        return attempt
+
+
+class SubmitExamBatchSerializer(serializers.Serializer):
+    """
+    考点离线缓存后一次性上传多份提交：
+    所有 attempt 一条查询加锁读取，答案表一次取出，
+    全部 AttemptAnswer 一次 bulk_create，每份提交单独返回状态而不是整批失败
+    """
+    ACCEPTED = 'accepted'
+    ALREADY_SUBMITTED = 'already_submitted'
+    INVALID = 'invalid'
 
-            # 题目维度增量
-            for aa in aa_bulk:
-                stat, _ = QuestionStat.objects.get_or_create(question=aa.question)
-                stat.bump(aa.is_correct)
-
-            # 选项维度增量（一次性应用所有变化）
-            for cid, delta in per_choice_delta.items():
-                stat, _ = ChoiceStat.objects.get_or_create(choice_id=cid)
-                # 用 F 表达式叠加
-                ChoiceStat.objects.filter(pk=stat.pk).update(
-                    selected_count=F('selected_count') + delta['sel'],
-                    wrong_selected_count=F('wrong_selected_count') + delta['wrong']
+    submissions = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=500
+    )
+
+    def create(self, validated_data):
+        results = []
+        valid = []  # (结果下标, validated_data)
+        for item in validated_data['submissions']:
+            item_ser = SubmitExamSerializer(data=item)
+            results.append({'attempt_token': str(item.get('attempt_token', ''))})
+            if item_ser.is_valid():
+                valid.append((len(results) - 1, item_ser.validated_data))
+            else:
+                results[-1].update(status=self.INVALID, errors=item_ser.errors)
+
+        grader = SubmitExamSerializer()
+        now = timezone.now()
+
+        with transaction.atomic():
+            tokens = [data['attempt_token'] for _, data in valid]
+            attempts = {
+                a.attempt_token: a
+                for a in Attempt.objects.select_for_update().filter(attempt_token__in=tokens)
+            }
+
+            # 合并自动保存的暂存答案，再一次取出全部题目的答案表
+            payloads = {
+                idx: autosave.merge(
+                    autosave.staged_answers(attempts[data['attempt_token']]), data.get('answers')
+                ) if data['attempt_token'] in attempts else []
+                for idx, data in valid
+            }
+            q_ids = {a['question_id'] for answers in payloads.values() for a in answers}
+            answer_key = get_answer_key(q_ids) if q_ids else {}
+
+            aa_bulk, events, graded = [], [], []
+            seen = set()
+            for idx, data in valid:
+                result = results[idx]
+                token = data['attempt_token']
+                attempt = attempts.get(token)
+                if attempt is None:
+                    result.update(status=self.INVALID, errors={'attempt_token': ['Attempt not found.']})
+                    continue
+                if attempt.submitted_at or token in seen:
+                    result.update(status=self.ALREADY_SUBMITTED, attempt_id=str(attempt.id))
+                    continue
+                answers = payloads[idx]
+                foreign = grader._foreign_question_ids(attempt, answers)
+                if foreign:
+                    result.update(status=self.INVALID, errors={'answers': [f'Questions not part of this attempt: {foreign}']})
+                    continue
+                answers, unknown = grader._known_answers(attempt, answers, answer_key)
+                if unknown:
+                    result.update(status=self.INVALID, errors={'answers': [f'Unknown question ids: {unknown}']})
+                    continue
+
+                seen.add(token)
+                rows, event = grader._grade(
+                    attempt, answers, answer_key, data.get('submitted_at') or now
+                )
+                aa_bulk.extend(rows)
+                events.append(event)
+                graded.append(attempt)
+                result.update(
+                    status=self.ACCEPTED,
+                    attempt_id=str(attempt.id),
+                    score=attempt.score,
+                    total_marks=attempt.total_marks,
                 )
 
-        return attempt
+            AttemptAnswer.objects.bulk_create(aa_bulk)
+            Attempt.objects.bulk_update(
+                graded, ['total_marks', 'score', 'submitted_at', 'duration_seconds']
+            )
+            StatEvent.objects.bulk_create(events)
+            transaction.on_commit(lambda: autosave.discard([a.attempt_token for a in graded]))
+
+        return results
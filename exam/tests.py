@@ -1,3 +1,466 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import autosave
+from .answer_keys import get_answer_key, compile_answer_key
+from .grading import EncodedKey, EncodedResponses, grade
+from .models import Attempt, AttemptAnswer, QuestionStat, ChoiceStat, StatEvent
+from .serializers import SubmitExamSerializer
+from questions.models import Question, Choice
+from students.models import Student
+from testpaper.models import TestPaper
+
+
+def make_paper(n_questions, title="Paper"):
+    """建一张 n 道单选题的试卷，每题两个选项，第二个为正确答案"""
+    paper = TestPaper.objects.create(title=title, level="Level 1")
+    questions = Question.objects.bulk_create([
+        Question(
+            name=f"Q{i}",
+            type="Single Choice",
+            level="Level 1",
+            category="Grammar",
+            marks=1,
+            question_text=f"Question {i}",
+        )
+        for i in range(n_questions)
+    ])
+    Choice.objects.bulk_create([
+        Choice(question=q, text=text, is_correct=(text == "right"))
+        for q in questions
+        for text in ("wrong", "right")
+    ])
+    paper.questions.set(questions)
+    return paper, questions
+
+
+def start_attempt(paper, student_no="S1"):
+    student, _ = Student.objects.get_or_create(student_no=student_no, defaults={"name": "Alice"})
+    return Attempt.objects.create(paper=paper, student=student, started_at=timezone.now())
+
+
+def answers_for(questions, pick_right):
+    """pick_right(i) -> 第 i 题是否选正确选项"""
+    answers = []
+    for i, q in enumerate(questions):
+        choices = {c.text: c.id for c in q.choices.all()}
+        answers.append({
+            "question_id": q.id,
+            "selected_choice_ids": [choices["right" if pick_right(i) else "wrong"]],
+        })
+    return answers
+
+
+def submit(attempt, answers):
+    ser = SubmitExamSerializer(data={
+        "attempt_token": str(attempt.attempt_token),
+        "answers": answers,
+    })
+    ser.is_valid(raise_exception=True)
+    return ser.save()
+
+
+def fold_stats():
+    call_command("fold_stats", stdout=StringIO())
+
+
+class SubmitStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_submit_writes_outbox_event_only(self):
+        paper, questions = make_paper(3)
+        attempt = submit(start_attempt(paper), answers_for(questions, lambda i: True))
+
+        self.assertTrue(StatEvent.objects.filter(attempt=attempt).exists())
+        self.assertFalse(QuestionStat.objects.exists())
+        self.assertFalse(ChoiceStat.objects.exists())
+
+    def test_stats_are_accumulated(self):
+        paper, questions = make_paper(4)
+        for n, student_no in enumerate(["S1", "S2"]):
+            attempt = start_attempt(paper, student_no)
+            submit(attempt, answers_for(questions, lambda i: i % 2 == n))
+        fold_stats()
+
+        for q in questions:
+            stat = QuestionStat.objects.get(question=q)
+            self.assertEqual((stat.attempts_count, stat.correct_count, stat.wrong_count), (2, 1, 1))
+        for c in Choice.objects.filter(question__in=questions):
+            stat = ChoiceStat.objects.get(choice=c)
+            self.assertEqual(stat.selected_count, 1)
+            self.assertEqual(stat.wrong_selected_count, 0 if c.is_correct else 1)
+
+    def test_fold_is_idempotent(self):
+        paper, questions = make_paper(2)
+        submit(start_attempt(paper), answers_for(questions, lambda i: True))
+        fold_stats()
+        fold_stats()
+
+        self.assertFalse(StatEvent.objects.exists())
+        for q in questions:
+            self.assertEqual(QuestionStat.objects.get(question=q).attempts_count, 1)
+
+    def test_stat_queries_do_not_grow_with_paper_size(self):
+        """基准：试卷从 5 题涨到 60 题，折叠一个事件时统计表上的语句条数保持不变"""
+        def stat_queries(n_questions):
+            paper, questions = make_paper(n_questions, title=f"P{n_questions}")
+            attempt = start_attempt(paper, f"S{n_questions}")
+            submit(attempt, answers_for(questions, lambda i: i % 3 == 0))
+            with CaptureQueriesContext(connection) as ctx:
+                fold_stats()
+            return [
+                q["sql"] for q in ctx.captured_queries
+                if "exam_questionstat" in q["sql"] or "exam_choicestat" in q["sql"]
+            ]
+
+        small = stat_queries(5)
+        large = stat_queries(60)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 6)
+
+
+class AnswerKeyCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_key_needs_no_queries(self):
+        paper, questions = make_paper(10)
+        q_ids = [q.id for q in questions]
+        key = get_answer_key(q_ids)
+        right = Choice.objects.get(question=questions[0], is_correct=True)
+        self.assertEqual(key[questions[0].id].correct_ids, frozenset([right.id]))
+
+        with self.assertNumQueries(0):
+            get_answer_key(q_ids)
+
+    def test_choice_save_invalidates_key(self):
+        paper, questions = make_paper(2)
+        q_ids = [q.id for q in questions]
+        get_answer_key(q_ids)
+
+        wrong = Choice.objects.get(question=questions[0], is_correct=False)
+        wrong.is_correct = True
+        wrong.save()
+
+        key = get_answer_key(q_ids)
+        self.assertIn(wrong.id, key[questions[0].id].correct_ids)
+
+    def test_submit_queries_do_not_grow_with_paper_size(self):
+        """基准：答案表已缓存时，整个提交的语句条数与题量无关"""
+        def submit_queries(n_questions):
+            paper, questions = make_paper(n_questions, title=f"P{n_questions}")
+            attempt = start_attempt(paper, f"S{n_questions}")
+            answers = answers_for(questions, lambda i: True)
+            get_answer_key([q.id for q in questions])
+            with CaptureQueriesContext(connection) as ctx:
+                submit(attempt, answers)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(submit_queries(5), submit_queries(60))
+
+
+class BatchGradingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_vectorized_grade_matches_score_one(self):
+        paper, questions = make_paper(2)
+        multi = questions[1]
+        multi.type = "Multiple Choice"
+        multi.save()
+        Choice.objects.filter(question=multi).update(is_correct=True)
+        key = compile_answer_key([q.id for q in questions])
+        single_ids = sorted(key[questions[0].id].choice_ids)
+        multi_ids = sorted(key[multi.id].choice_ids)
+
+        rows = [
+            (questions[0].id, [single_ids[1]]),
+            (questions[0].id, [single_ids[0]]),
+            (questions[0].id, [single_ids[1], single_ids[1]]),
+            (questions[0].id, [multi_ids[0]]),
+            (questions[0].id, []),
+            (multi.id, multi_ids),
+            (multi.id, [multi_ids[0]]),
+            (multi.id, multi_ids + [single_ids[0]]),
+            (multi.id, [multi_ids[0], multi_ids[1], multi_ids[0]]),
+        ]
+        encoded = EncodedKey(key)
+        ok, awarded, _ = grade(encoded, EncodedResponses(encoded, rows))
+
+        scorer = SubmitExamSerializer()
+        expected = [scorer._score_one(key[qid], sel, "") for qid, sel in rows]
+        self.assertEqual(list(zip(ok.tolist(), awarded.tolist())), expected)
+
+    def test_regrade_paper_after_key_correction(self):
+        paper, questions = make_paper(3)
+        attempt = submit(start_attempt(paper), answers_for(questions, lambda i: i == 0))
+        self.assertEqual(attempt.score, 1.0)
+
+        # 把第 2 题的正确答案改成 "wrong"
+        Choice.objects.filter(question=questions[1]).update(is_correct=~F("is_correct"))
+        call_command("regrade_paper", paper.id, stdout=StringIO())
+
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.score, attempt.total_marks), (2.0, 3.0))
+        self.assertTrue(attempt.answers.get(question=questions[1]).is_correct)
+        stat = QuestionStat.objects.get(question=questions[1])
+        self.assertEqual((stat.attempts_count, stat.correct_count, stat.wrong_count), (1, 1, 0))
+        # 第 2 题选的 "wrong" 现在是正确选项，不再算误选；"right" 变成了错误选项
+        choice_stats = {
+            cs.choice.text: (cs.selected_count, cs.wrong_selected_count)
+            for cs in ChoiceStat.objects.filter(choice__question=questions[1]).select_related("choice")
+        }
+        self.assertEqual(choice_stats, {"wrong": (1, 0)})
+
+    def test_regrade_after_marks_only_change(self):
+        paper, questions = make_paper(3)
+        submit(start_attempt(paper), answers_for(questions, lambda i: i == 0))
+        fold_stats()
+        Question.objects.filter(id=questions[0].id).update(marks=5)
+        call_command("regrade_paper", paper.id, stdout=StringIO())
+
+        answer = AttemptAnswer.objects.get(question=questions[0])
+        self.assertEqual((answer.is_correct, answer.marks_awarded), (True, 5.0))
+        self.assertEqual(Attempt.objects.get().score, 5.0)
+        stats = {s.question_id: (s.attempts_count, s.correct_count, s.wrong_count)
+                 for s in QuestionStat.objects.all()}
+        self.assertEqual(stats, {questions[0].id: (1, 1, 0), questions[1].id: (1, 0, 1),
+                                 questions[2].id: (1, 0, 1)})
+
+
+class SubmitBatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_per_submission_status(self):
+        paper, questions = make_paper(3)
+        fresh = [start_attempt(paper, f"S{i}") for i in range(3)]
+        done = submit(start_attempt(paper, "DONE"), answers_for(questions, lambda i: True))
+        answers = answers_for(questions, lambda i: i < 2)
+
+        payload = {"submissions": [
+            {"attempt_token": str(a.attempt_token), "answers": answers} for a in fresh
+        ] + [
+            {"attempt_token": str(done.attempt_token), "answers": answers},
+            {"attempt_token": str(fresh[0].attempt_token), "answers": answers},
+            {"attempt_token": "not-a-uuid", "answers": answers},
+        ]}
+        resp = self.client.post("/exam/submit-batch/", payload, content_type="application/json")
+
+        self.assertEqual(resp.status_code, 200)
+        statuses = [r["status"] for r in resp.json()["results"]]
+        self.assertEqual(statuses, ["accepted"] * 3 + ["already_submitted"] * 2 + ["invalid"])
+        for a in fresh:
+            a.refresh_from_db()
+            self.assertEqual((a.score, a.total_marks), (2.0, 3.0))
+            self.assertEqual(a.answers.count(), 3)
+        self.assertEqual(StatEvent.objects.count(), 4)
+
+    def test_submitted_before_started_does_not_fail_the_batch(self):
+        paper, questions = make_paper(2)
+        early, normal = start_attempt(paper, "S1"), start_attempt(paper, "S2")
+        answers = answers_for(questions, lambda i: True)
+        resp = self.client.post("/exam/submit-batch/", {"submissions": [
+            {"attempt_token": str(early.attempt_token), "answers": answers,
+             "submitted_at": (early.started_at - timedelta(minutes=5)).isoformat()},
+            {"attempt_token": str(normal.attempt_token), "answers": answers},
+        ]}, content_type="application/json")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([r["status"] for r in resp.json()["results"]], ["accepted", "accepted"])
+        early.refresh_from_db()
+        self.assertEqual((early.duration_seconds, early.score), (0, 2.0))
+
+
+class AutosaveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def autosave(self, attempt, answers):
+        return self.client.post("/exam/autosave/", {
+            "attempt_token": str(attempt.attempt_token), "answers": answers,
+        }, content_type="application/json")
+
+    @override_settings(EXAM_AUTOSAVE_FLUSH_SECONDS=3600)
+    def test_submit_grades_staged_answers(self):
+        paper, questions = make_paper(3)
+        attempt = start_attempt(paper)
+        answers = answers_for(questions, lambda i: True)
+        for item in answers:
+            self.assertEqual(self.autosave(attempt, [item]).status_code, 200)
+
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.draft_answers, {})  # 还没到落库间隔
+
+        resp = self.client.get("/exam/autosave/", {"attempt_token": str(attempt.attempt_token)})
+        self.assertEqual([a["question_id"] for a in resp.json()["answers"]], sorted(q.id for q in questions))
+
+        # 最后一题在提交时改成错误答案，覆盖暂存的版本
+        with self.captureOnCommitCallbacks(execute=True):
+            submit(attempt, answers_for(questions[2:], lambda i: False))
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.score, attempt.total_marks), (2.0, 3.0))
+        self.assertEqual(self.autosave(attempt, answers[:1]).status_code, 404)
+
+    @override_settings(EXAM_AUTOSAVE_FLUSH_SECONDS=0)
+    def test_buffer_is_flushed_and_survives_cache_loss(self):
+        paper, questions = make_paper(2)
+        attempt = start_attempt(paper)
+        resp = self.autosave(attempt, answers_for(questions, lambda i: True))
+        self.assertTrue(resp.json()["flushed"])
+
+        cache.clear()
+        submit(attempt, [])
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.score, 2.0)
+
+
+    @override_settings(EXAM_AUTOSAVE_FLUSH_SECONDS=3600)
+    def test_newer_draft_beats_older_buffer(self):
+        paper, questions = make_paper(2)
+        attempt = start_attempt(paper)
+        right = answers_for(questions, lambda i: True)
+        wrong = answers_for(questions, lambda i: False)
+        autosave.stage(attempt.attempt_token, right, now=100.0)
+        # 另一个 worker 更晚落库的草稿：第一题改成了错误答案
+        Attempt.objects.filter(id=attempt.id).update(
+            draft_answers={str(questions[0].id): dict(wrong[0], saved_at=200.0)}
+        )
+        attempt.refresh_from_db()
+        staged = autosave.staged_answers(attempt)
+        self.assertEqual(staged[questions[0].id], wrong[0])
+        self.assertEqual(staged[questions[1].id], right[1])
+
+    def test_questions_outside_the_frozen_set_are_not_staged(self):
+        paper, questions = make_paper(3)
+        attempt = start_attempt(paper)
+        Attempt.objects.filter(id=attempt.id).update(question_ids=[q.id for q in questions[:2]])
+        answers = answers_for(questions, lambda i: True)
+
+        resp = self.autosave(attempt, answers)  # 整批拒绝，一题都不暂存
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn(str(questions[2].id), resp.json()["answers"][0])
+        self.assertEqual(self.autosave(attempt, answers[:2]).status_code, 200)
+        self.assertEqual(self.autosave(attempt, answers[2:]).status_code, 400)  # 缓冲区已存在时也校验
+
+        attempt.refresh_from_db()
+        attempt = submit(attempt, [])
+        self.assertEqual((attempt.score, attempt.total_marks), (2.0, 2.0))
+
+    def test_concurrent_stage_waits_for_the_lock(self):
+        paper, questions = make_paper(2)
+        attempt = start_attempt(paper)
+        items = answers_for(questions, lambda i: True)
+        with autosave._locked(attempt.attempt_token):
+            with self.assertRaises(autosave.AutosaveBusy):
+                autosave.stage(attempt.attempt_token, items[:1], wait=0)
+        autosave.stage(attempt.attempt_token, items[:1])
+        autosave.stage(attempt.attempt_token, items[1:])
+        self.assertEqual(len(autosave.staged_answers(attempt)), 2)
+
+
+class StartExamTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def start(self, paper_id, **student):
+        return self.client.post("/exam/start/", {
+            "paper_id": paper_id,
+            "student": {"student_no": "S1", "name": "Alice", **student},
+        }, content_type="application/json", HTTP_USER_AGENT="pytest", REMOTE_ADDR="10.0.0.1")
+
+    def test_start_is_two_writes(self):
+        paper, _ = make_paper(1)
+        Student.objects.create(student_no="S1", name="Old", email="a@example.com")
+        self.start(paper.id)  # 预热试卷存在性缓存
+
+        with self.assertNumQueries(3):  # upsert 学生 + 取学生 id + insert attempt
+            resp = self.start(paper.id, name="Alice B")
+        self.assertEqual(resp.status_code, 201)
+
+        attempt = Attempt.objects.get(id=resp.json()["attempt_id"])
+        self.assertEqual((attempt.user_agent, attempt.ip_address), ("pytest", "10.0.0.1"))
+        self.assertEqual(attempt.question_ids, [q["id"] for q in resp.json()["questions"]])
+        self.assertEqual(attempt.student.name, "Alice B")
+        self.assertEqual(attempt.student.email, "a@example.com")
+        self.assertEqual(Student.objects.count(), 1)
+        self.assertEqual(attempt.student_id, Student.objects.get(student_no="S1").id)
+
+    def test_unknown_paper_is_rejected(self):
+        self.assertEqual(self.start(999).status_code, 400)
+
+
+class FrozenQuestionSetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_start_freezes_generated_questions(self):
+        paper, questions = make_paper(5)
+        paper.level_config = {"Level 1": {"mode": "count", "exam_questions": 3}}
+        paper.save()
+        resp = self.client.post("/exam/start/", {
+            "paper_id": paper.id, "student": {"student_no": "S1", "name": "Alice"},
+        }, content_type="application/json")
+
+        self.assertEqual(resp.status_code, 201)
+        rendered = resp.json()["questions"]
+        self.assertEqual(len(rendered), 3)
+        self.assertNotIn("is_correct", rendered[0]["choices"][0])
+        attempt = Attempt.objects.get(id=resp.json()["attempt_id"])
+        self.assertEqual(attempt.question_ids, [q["id"] for q in rendered])
+
+        outside = [q for q in questions if q.id not in attempt.question_ids]
+        with self.assertRaises(ValidationError):
+            submit(attempt, answers_for(outside[:1], lambda i: True))
+
+        inside = [q for q in questions if q.id in attempt.question_ids]
+        attempt = submit(attempt, answers_for(inside, lambda i: True))
+        self.assertEqual(attempt.score, 3.0)
+
+    def test_paper_change_invalidates_cached_spec(self):
+        paper, questions = make_paper(2)
+        start = lambda: self.client.post("/exam/start/", {
+            "paper_id": paper.id, "student": {"student_no": "S1", "name": "Alice"},
+        }, content_type="application/json").json()
+        self.assertEqual(len(start()["questions"]), 2)
+
+        paper.questions.remove(questions[0])
+        self.assertEqual([q["id"] for q in start()["questions"]], [questions[1].id])
+
+    def test_question_deleted_after_start_is_ignored(self):
+        paper, questions = make_paper(3)
+        start = lambda student_no: Attempt.objects.get(id=self.client.post("/exam/start/", {
+            "paper_id": paper.id, "student": {"student_no": student_no, "name": "Alice"},
+        }, content_type="application/json").json()["attempt_id"])
+        single, batched = start("S1"), start("S2")
+        self.assertEqual(sorted(single.question_ids), [q.id for q in questions])
+        answers = answers_for(questions, lambda i: True)
+
+        questions[0].delete()
+        # 已开考的作答照常交卷，被删的题不计分
+        single = submit(single, answers)
+        self.assertEqual((single.score, single.total_marks), (2.0, 2.0))
+        resp = self.client.post("/exam/submit-batch/", {"submissions": [
+            {"attempt_token": str(batched.attempt_token), "answers": answers},
+        ]}, content_type="application/json")
+        self.assertEqual(resp.json()["results"][0]["status"], "accepted")
+        self.assertEqual(resp.json()["results"][0]["score"], 2.0)
+        # 之后开考的不会再冻结到已删的题
+        self.assertEqual(sorted(start("S3").question_ids), [q.id for q in questions[1:]])
@@ -1,11 +1,13 @@
 # exams/urls.py
 from django.urls import path
-from .views import StartExamAPI, SubmitExamAPI, PaperStatsAPI, QuestionChoiceStatsAPI
-from .views import PaperResultAPI,GlobalStatsAPI
+from .views import StartExamAPI, SubmitExamAPI, SubmitExamBatchAPI, PaperStatsAPI, QuestionChoiceStatsAPI
+from .views import PaperResultAPI,GlobalStatsAPI, AutosaveAPI
 
 urlpatterns = [
     path('start/', StartExamAPI.as_view()),
     path('submit/', SubmitExamAPI.as_view()),
+    path('submit-batch/', SubmitExamBatchAPI.as_view()),
+    path('autosave/', AutosaveAPI.as_view()),
     path('admin/papers/<int:paper_id>/stats/', PaperStatsAPI.as_view()),
     path('questions/<int:question_id>/choice-stats/', QuestionChoiceStatsAPI.as_view()),
     path('admin/papers/<int:paper_id>/result/', PaperResultAPI.as_view()),
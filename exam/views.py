@@ -4,11 +4,15 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Avg, Sum, Count, Max, Q, F, Value
 from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
 
-from .serializers import StartExamSerializer, SubmitExamSerializer
+from .serializers import StartExamSerializer, SubmitExamSerializer, SubmitExamBatchSerializer
+from .serializers import AutosaveSerializer
+from . import autosave
 from .models import Attempt, AttemptAnswer, ChoiceStat
 from questions.models import Choice
 from testpaper.models import TestPaper
+from testpaper.generation import render_questions
 from students.models import Student
 
 
@@ -114,16 +118,18 @@ class StartExamAPI(APIView):
     def post(self, request):
         ser = StartExamSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        attempt = ser.save()
-        attempt.user_agent = request.META.get('HTTP_USER_AGENT', '')
-        attempt.ip_address = _client_ip(request)
-        attempt.save(update_fields=['user_agent', 'ip_address'])
+        attempt = ser.save(
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            ip_address=_client_ip(request),
+        )
 
         return Response({
             'attempt_id': str(attempt.id),
             'attempt_token': str(attempt.attempt_token),
             'paper_id': attempt.paper_id,
             'started_at': attempt.started_at.isoformat(),
+            'questions': (ser.validated_data.get('rendered_questions')
+                          or render_questions(attempt.question_ids)),
         }, status=status.HTTP_201_CREATED)
 
 class SubmitExamAPI(APIView):
@@ -150,6 +156,66 @@ class SubmitExamAPI(APIView):
             'details': list(details),
         }, status=status.HTTP_200_OK)
 
+class AutosaveAPI(APIView):
+    """
+    POST /api/exam/autosave/   {"attempt_token": ..., "answers": [...]}  暂存最新答案
+    GET  /api/exam/autosave/?attempt_token=...                          断线重连后取回暂存答案
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        ser = AutosaveSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        try:
+            buf, flushed = autosave.stage(
+                ser.validated_data['attempt_token'], ser.validated_data['answers']
+            )
+        except Attempt.DoesNotExist:
+            return Response({"detail": "Attempt not found or already submitted"},
+                            status=status.HTTP_404_NOT_FOUND)
+        except autosave.ForeignQuestions as exc:
+            return Response({"answers": [f"Questions not part of this attempt: {exc.args[0]}"]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except autosave.AutosaveBusy:
+            return Response({"detail": "Another autosave for this attempt is in progress, retry"},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({
+            'attempt_token': str(ser.validated_data['attempt_token']),
+            'staged': len(buf['answers']),
+            'flushed': flushed,
+        }, status=status.HTTP_200_OK)
+
+    def get(self, request):
+        token = request.query_params.get('attempt_token')
+        try:
+            attempt = Attempt.objects.only('attempt_token', 'draft_answers').get(
+                attempt_token=token, submitted_at__isnull=True
+            )
+        except (Attempt.DoesNotExist, ValidationError):
+            return Response({"detail": "Attempt not found or already submitted"},
+                            status=status.HTTP_404_NOT_FOUND)
+        staged = autosave.staged_answers(attempt)
+        return Response({
+            'attempt_token': str(attempt.attempt_token),
+            'answers': [staged[qid] for qid in sorted(staged)],
+        }, status=status.HTTP_200_OK)
+
+class SubmitExamBatchAPI(APIView):
+    """
+    POST /api/exam/submit-batch/
+    考点批量同步：{"submissions": [{attempt_token, answers, submitted_at}, ...]}
+    每份提交返回 accepted / already_submitted / invalid
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        ser = SubmitExamBatchSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        results = ser.save()
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
 class PaperStatsAPI(APIView):
     """
     GET /api/admin/papers/<paper_id>/stats
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .versions import cache_is_shared
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Error(
+        f"CACHES['default'] uses {settings.CACHES['default']['BACKEND']}, which is local to each process.",
+        hint=(
+            "Version stamps, answer keys, autosave buffers and variant pools must be shared by the "
+            "web workers and the management-command workers: use Redis (REDIS_URL)."
+        ),
+        id="questions.E001",
+    )]
@@ -0,0 +1,52 @@
+"""
+Conditional GET for read-heavy viewsets.
+
+The ETag of a list/retrieve response is a hash of the request (host, path,
+sorted query string) and the change versions (questions.versions) of every
+table the payload is built from. The versions are bumped by signals, so a
+matching If-None-Match is answered with 304 before any ORM query or
+serializer runs.
+
+Some versions are bumped by other processes (QUESTION_STATS by fold_stats and
+regrade_paper, the bank by run_import_jobs), so the tags are only trusted on
+a shared cache; on a process-local one the responses carry no ETag at all.
+"""
+import hashlib
+
+from rest_framework import status
+from rest_framework.response import Response
+from django.utils.http import parse_etags
+
+from .versions import cache_is_shared, get_version
+
+
+class VersionETagMixin:
+    # version names (questions.versions) the payload depends on
+    etag_versions = ()
+
+    def get_etag(self, request):
+        # query parameters in sorted order, so ?a=1&b=2 and ?b=2&a=1 share a tag
+        query = "&".join(sorted(request.GET.urlencode().split("&")))
+        parts = [request.get_host(), request.path, query]
+        parts.extend(f"{name}={get_version(name)}" for name in self.etag_versions)
+        return '"%s"' % hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        if not cache_is_shared():
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(request)
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and etag in parse_etags(if_none_match):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = etag
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
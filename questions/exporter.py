@@ -0,0 +1,70 @@
+"""
+Streaming export of the question bank.
+
+Rows are read with ``.iterator(chunk_size=...)`` and choices are prefetched per
+chunk, so memory stays constant however large the bank is. CSV uses the same
+columns that ``import_csv`` accepts, so an export can be imported back as is.
+"""
+import csv
+import json
+
+from django.db.models import Prefetch
+
+from .importer import COLUMNS
+from .models import Choice
+
+CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def iter_questions(queryset, chunk_size=CHUNK_SIZE):
+    queryset = (
+        queryset.order_by("id")
+        .only("id", "name", "type", "level", "category", "marks", "question_text")
+        .prefetch_related(
+            Prefetch("choices", queryset=Choice.objects.order_by("id").only(
+                "id", "question_id", "text", "is_correct"
+            ))
+        )
+    )
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def csv_lines(queryset):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for q in iter_questions(queryset):
+        choices = list(q.choices.all())
+        yield writer.writerow([
+            q.name,
+            q.type,
+            q.level,
+            q.category,
+            q.marks,
+            q.question_text,
+            "|".join(c.text for c in choices),
+            ",".join(str(i) for i, c in enumerate(choices) if c.is_correct),
+        ])
+
+
+def ndjson_lines(queryset):
+    for q in iter_questions(queryset):
+        yield json.dumps({
+            "id": q.id,
+            "name": q.name,
+            "type": q.type,
+            "level": q.level,
+            "category": q.category,
+            "marks": q.marks,
+            "question": q.question_text,
+            "choices": [
+                {"id": c.id, "text": c.text, "is_correct": c.is_correct}
+                for c in q.choices.all()
+            ],
+        }, ensure_ascii=False) + "\n"
@@ -0,0 +1,232 @@
+"""
+Streaming CSV import for the question bank.
+
+The upload is read line by line and decoded with an incremental UTF-8 decoder,
+then parsed row by row; valid rows are buffered only up to ``batch_size`` and each
+chunk is committed in its own transaction, so memory stays bounded by the
+chunk size rather than the file size. Invalid rows are skipped and reported
+(line number + reasons) instead of aborting the import.
+
+Expected header:
+    name,type,level,category,marks,question,choices,correctIndex
+
+Large uploads are spooled to disk as an ImportJob instead and ingested by
+``manage.py run_import_jobs`` (claim_job + run_job below), which records
+progress on the job row in the same transaction as every chunk. A job whose
+worker died is re-queued after QUESTION_IMPORT_STALE_SECONDS and resumes
+after the last committed chunk.
+"""
+import codecs
+import csv
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Choice, ImportJob, Question
+from .search import index_questions
+from .versions import QUESTION_POOL, bump_version
+
+COLUMNS = ["name", "type", "level", "category", "marks", "question", "choices", "correctIndex"]
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+MAX_REPORTED_ERRORS = 100
+
+QUESTION_TYPES = {value for value, _ in Question.QUESTION_TYPES}
+LEVELS = {value for value, _ in Question.LEVELS}
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported at all (wrong header, not text, ...)"""
+
+
+def parse_row(row):
+    """
+    Validate one CSV record. Returns (Question, [(text, is_correct), ...], errors);
+    the question is None when errors is non-empty.
+    """
+    errors = []
+
+    if not (row.get("name") or "").strip():
+        errors.append("name is required")
+    if row.get("type") not in QUESTION_TYPES:
+        errors.append(f"unknown type {row.get('type')!r}")
+    if row.get("level") not in LEVELS:
+        errors.append(f"unknown level {row.get('level')!r}")
+
+    marks = None
+    try:
+        marks = int(row.get("marks") or "")
+        if not 1 <= marks <= 100:
+            errors.append(f"marks must be between 1 and 100, got {marks}")
+    except ValueError:
+        errors.append(f"marks is not an integer: {row.get('marks')!r}")
+
+    choices = [text.strip() for text in (row.get("choices") or "").split("|")]
+    if not any(choices):
+        errors.append("choices is empty")
+
+    correct = set()
+    try:
+        correct = {int(x) for x in (row.get("correctIndex") or "").split(",")}
+        out_of_range = sorted(i for i in correct if not 0 <= i < len(choices))
+        if out_of_range:
+            errors.append(f"correctIndex {out_of_range} out of range for {len(choices)} choices")
+    except ValueError:
+        errors.append(f"correctIndex is not a list of integers: {row.get('correctIndex')!r}")
+
+    if errors:
+        return None, [], errors
+
+    question = Question(
+        name=row["name"],
+        type=row["type"],
+        level=row["level"],
+        category=row["category"],
+        marks=marks,
+        question_text=row["question"],
+    )
+    return question, [(text, i in correct) for i, text in enumerate(choices)], []
+
+
+def decode_lines(binary_file, encoding="utf-8-sig"):
+    """Yield text lines from a binary file without reading it all into memory"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for line in binary_file:
+        yield decoder.decode(line)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class QuestionCSVImporter:
+    """
+    importer = QuestionCSVImporter(batch_size=1000)
+    report = importer.run(uploaded_file)   # binary file-like object
+
+    on_chunk(report) is called inside every chunk's transaction (progress reporting).
+    resume_from (a previous report) skips the rows that report already covers.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS, on_chunk=None,
+                 resume_from=None):
+        self.batch_size = max(1, min(int(batch_size), MAX_BATCH_SIZE))
+        self.max_errors = max_errors
+        self.on_chunk = on_chunk
+        self.report = {"rows": 0, "imported": 0, "failed": 0, "errors": []}
+        if resume_from:
+            self.report.update(resume_from)
+            self.report["errors"] = list(self.report["errors"])
+        self.skip_rows = self.report["rows"]
+
+    def _error(self, line, errors):
+        self.report["failed"] += 1
+        if len(self.report["errors"]) < self.max_errors:
+            self.report["errors"].append({"line": line, "errors": errors})
+
+    def _commit(self, chunk):
+        if not chunk:
+            return
+        with transaction.atomic():
+            created = Question.objects.bulk_create([q for q, _ in chunk])
+            Choice.objects.bulk_create([
+                Choice(question=q, text=text, is_correct=is_correct)
+                for q, (_, choices) in zip(created, chunk)
+                for text, is_correct in choices
+            ])
+            index_questions(created)
+            self.report["imported"] += len(created)
+            if self.on_chunk:
+                # same transaction: a resumed job never imports this chunk twice
+                self.on_chunk(self.report)
+        # bulk_create skips post_save signals, so bump the versions by hand
+        bump_version()
+        bump_version(QUESTION_POOL)
+
+    def run(self, binary_file):
+        reader = csv.DictReader(decode_lines(binary_file))
+        try:
+            header = reader.fieldnames or []
+        except UnicodeDecodeError:
+            raise ImportFormatError("File is not UTF-8 encoded text")
+        missing = [c for c in COLUMNS if c not in header]
+        if missing:
+            raise ImportFormatError(f"Missing columns: {', '.join(missing)}")
+
+        chunk = []
+        seen = 0
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except (UnicodeDecodeError, csv.Error) as e:
+                # the rest of the file cannot be read reliably; keep what was committed
+                self._error(reader.line_num + 1, [f"unreadable input: {e}"])
+                break
+            seen += 1
+            if seen <= self.skip_rows:
+                continue
+            self.report["rows"] += 1
+            question, choices, errors = parse_row(row)
+            if errors:
+                self._error(reader.line_num, errors)
+                continue
+            chunk.append((question, choices))
+            if len(chunk) >= self.batch_size:
+                self._commit(chunk)
+                chunk = []
+        self._commit(chunk)
+        return self.report
+
+
+def requeue_stale_jobs():
+    """Put running jobs whose worker stopped reporting back in the queue; returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=settings.QUESTION_IMPORT_STALE_SECONDS)
+    return ImportJob.objects.filter(status="running", heartbeat_at__lt=cutoff).update(status="queued")
+
+
+def claim_job():
+    """Take the oldest queued job (safe with several workers); None when the queue is empty"""
+    requeue_stale_jobs()
+    for job_id in ImportJob.objects.filter(status="queued").values_list("id", flat=True)[:10]:
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(id=job_id, status="queued").update(
+            status="running", started_at=Coalesce("started_at", Value(now)), heartbeat_at=now,
+        )
+        if claimed:
+            return ImportJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """Ingest a claimed job's spooled file (resuming a re-queued one), then delete the file"""
+    def progress(report):
+        ImportJob.objects.filter(id=job.id).update(
+            rows=report["rows"], imported=report["imported"],
+            failed=report["failed"], errors=report["errors"],
+            heartbeat_at=timezone.now(),
+        )
+
+    resume_from = {"rows": job.rows, "imported": job.imported, "failed": job.failed, "errors": job.errors}
+    importer = QuestionCSVImporter(job.batch_size, on_chunk=progress, resume_from=resume_from)
+    job.status = "done"
+    try:
+        with job.file.open("rb") as f:
+            importer.run(f)
+    except ImportFormatError as e:
+        job.status, job.detail = "failed", str(e)
+    except Exception as e:
+        job.status, job.detail = "failed", f"{type(e).__name__}: {e}"
+
+    report = importer.report
+    job.rows, job.imported, job.failed, job.errors = (
+        report["rows"], report["imported"], report["failed"], report["errors"]
+    )
+    job.finished_at = timezone.now()
+    job.file.delete(save=False)
+    job.save()
+    return job
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from questions.media import InvalidImage, save_question_image
+from questions.models import QuestionImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the resized and WebP renditions (and content-hash names) for question "
+        "images uploaded before the media pipeline existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Reprocess images that already have renditions.")
+
+    def handle(self, *args, **options):
+        images = QuestionImage.objects.select_related("question")
+        if not options["all"]:
+            images = images.filter(digest="")
+
+        done = failed = 0
+        for image in images.iterator(chunk_size=200):
+            try:
+                with image.image.open("rb") as f:
+                    save_question_image(image.question, f)
+                done += 1
+            except (OSError, InvalidImage) as e:
+                failed += 1
+                self.stderr.write(f"Image {image.id} ({image.image.name}): {e}")
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} images, {failed} failed."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from questions import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite FTS5 index used by ?search= on /questions/ from the questions table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        if connections[alias].vendor != "sqlite":
+            raise CommandError("Full-text index is SQLite only; other backends use icontains search.")
+        count = search.rebuild(alias)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} questions."))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from questions.importer import claim_job, run_job
+from questions.versions import cache_is_shared
+
+
+class Command(BaseCommand):
+    help = "Ingest queued question CSV imports (ImportJob rows created by import_csv)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and poll for new jobs every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # the version bumps below would never reach the web workers' pools and answer keys
+            raise CommandError(
+                "run_import_jobs needs a cache shared with the web workers "
+                "(Redis, see REDIS_URL), not a process-local one."
+            )
+        while True:
+            job = claim_job()
+            if job is not None:
+                job = run_job(job)
+                self.stdout.write(
+                    f"Import {job.id} {job.status}: {job.imported} imported, {job.failed} failed"
+                    + (f" ({job.detail})" if job.detail else "")
+                )
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
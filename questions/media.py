@@ -0,0 +1,201 @@
+"""
+Question image pipeline and media serving.
+
+Uploads are stored under content-hash names next to two renditions made with
+Pillow: a resized copy (longest edge QUESTION_IMAGE_MAX_EDGE, JPEG or PNG when
+the image has transparency) and a WebP copy of the same size. Identical
+uploads share one set of files.
+
+``serve_media`` replaces ``django.conf.urls.static`` for /media/: it sends
+ETag / Last-Modified, answers If-None-Match with 304, supports single byte
+Range requests, and marks content-hash files as immutable. With
+MEDIA_SENDFILE_MODE set to "x-accel-redirect" (nginx) or "x-sendfile"
+(Apache/lighttpd) the body is left to the web server.
+"""
+import hashlib
+import io
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import parse_etags
+from PIL import Image, ImageOps
+
+from .models import QuestionImage
+
+UPLOAD_DIR = "question_images"
+IMMUTABLE_NAME = re.compile(r"(^|/)[0-9a-f]{64}(_\w+)?\.\w+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60 * 60
+RANGE_CHUNK = 64 * 1024
+
+
+def max_edge():
+    return getattr(settings, "QUESTION_IMAGE_MAX_EDGE", 1280)
+
+
+def _digest(uploaded_file):
+    sha = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha.update(chunk)
+    uploaded_file.seek(0)
+    return sha.hexdigest()
+
+
+def _store(name, content):
+    """Content-hash names: if the file is already there it is identical, keep it"""
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, content)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def build_renditions(source, digest):
+    """Pillow renditions of an image file object; returns (display_name, webp_name)"""
+    size = max_edge()
+    try:
+        img = Image.open(source)
+        img.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+    with img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.LANCZOS)
+        has_alpha = img.mode in ("RGBA", "LA", "P") and (
+            img.mode != "P" or "transparency" in img.info
+        )
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        base = f"{UPLOAD_DIR}/{digest[:2]}/{digest}_{size}"
+        out = io.BytesIO()
+        if has_alpha:
+            display_name = f"{base}.png"
+            img.save(out, "PNG", optimize=True)
+        else:
+            display_name = f"{base}.jpg"
+            img.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        _store(display_name, ContentFile(out.getvalue()))
+
+        out = io.BytesIO()
+        img.save(out, "WEBP", quality=80, method=4)
+        webp_name = _store(f"{base}.webp", ContentFile(out.getvalue()))
+    return display_name, webp_name
+
+
+def save_question_image(question, uploaded_file):
+    """
+    Store an upload (original + renditions) and attach it to the question.
+    Raises InvalidImage when Pillow cannot read the file.
+    """
+    digest = _digest(uploaded_file)
+    display_name, webp_name = build_renditions(uploaded_file, digest)
+    uploaded_file.seek(0)
+    ext = os.path.splitext(uploaded_file.name)[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,5}", ext):
+        ext = ".img"
+    original_name = _store(f"{UPLOAD_DIR}/{digest[:2]}/{digest}{ext}", uploaded_file)
+    image, _ = QuestionImage.objects.update_or_create(
+        question=question,
+        defaults={"image": original_name, "display": display_name, "webp": webp_name, "digest": digest},
+    )
+    return image
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _parse_range(header, size):
+    """'bytes=a-b' -> (start, end) inclusive; None if absent/unsupported, False if unsatisfiable"""
+    m = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    if m.group(1) == "":
+        length = int(m.group(2))
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(RANGE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    etag = _etag(stat)
+    max_age = IMMUTABLE_MAX_AGE if IMMUTABLE_NAME.search(path) else MUTABLE_MAX_AGE
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={max_age}" + (", immutable" if max_age == IMMUTABLE_MAX_AGE else ""),
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    mode = getattr(settings, "MEDIA_SENDFILE_MODE", None)
+    if mode:
+        # the web server sends the bytes (and handles Range itself)
+        response = HttpResponse(content_type=content_type)
+        if mode == "x-accel-redirect":
+            prefix = getattr(settings, "MEDIA_SENDFILE_PREFIX", "/protected-media/")
+            response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + path.lstrip("/")
+        else:
+            response["X-Sendfile"] = full_path
+    else:
+        byte_range = _parse_range(request.headers.get("Range"), stat.st_size)
+        if request.headers.get("If-Range") not in (None, etag):
+            byte_range = None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(full_path, start, length), status=206, content_type=content_type
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(length)
+        else:
+            response = FileResponse(open(full_path, "rb"), content_type=content_type)
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
@@ -0,0 +1,40 @@
+# Full-text index for question search (SQLite FTS5 only, see questions/search.py)
+
+from django.db import migrations, OperationalError
+
+FTS_TABLE = "questions_question_fts"
+
+
+def create_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(name, question_text, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to icontains
+            return
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, question_text) "
+            "SELECT id, name, question_text FROM questions_question"
+        )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0003_alter_questionimage_question'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
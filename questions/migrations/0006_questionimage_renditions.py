@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionimage',
+            name='digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='questionimage',
+            name='display',
+            field=models.ImageField(blank=True, upload_to='question_images/'),
+        ),
+        migrations.AddField(
+            model_name='questionimage',
+            name='webp',
+            field=models.ImageField(blank=True, upload_to='question_images/'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0006_questionimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', 'id'], name='question_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:56
+
+import questions.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0007_question_question_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(blank=True, storage=questions.models.ImportSpoolStorage(), upload_to=''),
+        ),
+    ]
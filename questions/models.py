@@ -1,5 +1,8 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils.functional import cached_property
 
 
 class Question(models.Model):
@@ -30,6 +33,7 @@ class Question(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["-created_at", "id"], name="question_created_id_idx")]
 
     def __str__(self) -> str:
         return self.name
@@ -52,6 +56,62 @@ class QuestionImage(models.Model):
         Question, related_name="image", on_delete=models.CASCADE
     )
     image = models.ImageField(upload_to="question_images/")
+    # renditions made on upload (questions/media.py); blank for images uploaded before them
+    display = models.ImageField(upload_to="question_images/", blank=True)
+    webp = models.ImageField(upload_to="question_images/", blank=True)
+    digest = models.CharField(max_length=64, blank=True, db_index=True)
 
     def __str__(self) -> str:
         return f"Image for {self.question_id}"
+
+
+class ImportSpoolStorage(FileSystemStorage):
+    """
+    Queued CSV uploads (answer keys included) are kept under
+    QUESTION_IMPORT_SPOOL_ROOT, outside MEDIA_ROOT, so /media/ can never serve them
+    """
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.QUESTION_IMPORT_SPOOL_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == "QUESTION_IMPORT_SPOOL_ROOT":
+            self.__dict__.pop("base_location", None)
+            self.__dict__.pop("location", None)
+
+    def url(self, name):
+        raise ValueError("Spooled imports are private and have no URL")
+
+
+class ImportJob(models.Model):
+    """A CSV upload spooled to disk and ingested by `manage.py run_import_jobs`"""
+    STATUSES = [
+        ("queued", "queued"),
+        ("running", "running"),
+        ("done", "done"),
+        ("failed", "failed"),
+    ]
+
+    file = models.FileField(storage=ImportSpoolStorage(), blank=True)
+    file_name = models.CharField(max_length=255, blank=True)
+    batch_size = models.PositiveIntegerField(default=1000)
+    status = models.CharField(max_length=20, choices=STATUSES, default="queued", db_index=True)
+    rows = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    detail = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # refreshed on claim and after every committed chunk; a running job whose
+    # heartbeat is older than QUESTION_IMPORT_STALE_SECONDS lost its worker
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self) -> str:
+        return f"Import {self.id} ({self.status})"
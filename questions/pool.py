@@ -0,0 +1,62 @@
+"""
+Process-wide index of the question bank used by paper generation.
+
+For every (level, category) it keeps two compact, aligned columns:
+``ids`` (array of int64) and ``marks`` (array of int16). Generation picks
+positions in these columns entirely in memory and only the chosen ids are
+fetched afterwards. ``(level, None)`` holds every category of a level.
+
+The index is rebuilt lazily, with one query, whenever the QUESTION_POOL
+version (bumped on Question save/delete) differs from the one it was built at.
+"""
+from array import array
+from threading import Lock
+
+from .models import Question
+from .versions import QUESTION_POOL, get_version
+
+
+class QuestionPool:
+    __slots__ = ("ids", "marks")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.marks = array("h")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, question_id, marks):
+        self.ids.append(question_id)
+        self.marks.append(marks)
+
+
+class QuestionPoolIndex:
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._pools = {}
+
+    def _build(self):
+        pools = {}
+        rows = Question.objects.order_by("id").values_list("id", "level", "category", "marks")
+        for qid, level, category, marks in rows.iterator(chunk_size=5000):
+            for key in ((level, category), (level, None)):
+                pool = pools.get(key)
+                if pool is None:
+                    pool = pools[key] = QuestionPool()
+                pool.append(qid, marks)
+        return pools
+
+    def get(self, level, category=None):
+        version = get_version(QUESTION_POOL)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._pools = self._build()
+                    self._version = version
+        return self._pools.get((level, category)) or QuestionPool()
+
+
+pool_index = QuestionPoolIndex()
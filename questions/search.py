@@ -0,0 +1,115 @@
+"""
+Full-text search over Question.name / Question.question_text.
+
+On SQLite the text is mirrored into an FTS5 table (``questions_question_fts``,
+rowid = question id) that is kept in sync by the Question save/delete signals
+and can be rebuilt with ``manage.py rebuild_search_index``.
+``QuestionSearchFilter`` runs ``?search=`` through it and orders the matches by
+bm25 relevance. Other database backends, or a SQLite build without FTS5, fall
+back to DRF's plain ``icontains`` SearchFilter.
+"""
+from django.db import connections
+from rest_framework import filters
+
+FTS_TABLE = "questions_question_fts"
+
+_enabled = {}
+
+
+def fts_enabled(alias="default"):
+    """True when the FTS table exists on this connection (checked once per process)"""
+    if alias not in _enabled:
+        connection = connections[alias]
+        if connection.vendor != "sqlite":
+            _enabled[alias] = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [FTS_TABLE],
+                )
+                _enabled[alias] = cursor.fetchone() is not None
+    return _enabled[alias]
+
+
+def create_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(name, question_text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    _enabled.pop(connection.alias, None)
+
+
+def rebuild(alias="default"):
+    """Recreate the index from the questions table; returns the number of rows indexed"""
+    connection = connections[alias]
+    create_index(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, question_text) "
+            "SELECT id, name, question_text FROM questions_question"
+        )
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def index_questions(questions, alias="default"):
+    """Insert or refresh the index rows of these questions (used by signals and bulk imports)"""
+    if not fts_enabled(alias):
+        return
+    rows = [(q.id, q.name, q.question_text) for q in questions]
+    if not rows:
+        return
+    with connections[alias].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(r[0],) for r in rows])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, question_text) VALUES (%s, %s, %s)", rows
+        )
+
+
+def unindex_questions(question_ids, alias="default"):
+    if not fts_enabled(alias):
+        return
+    with connections[alias].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(i,) for i in question_ids])
+
+
+def match_expression(terms):
+    """
+    Turn user search terms into an FTS5 query: every term must match, as a
+    prefix, in either column. Terms are quoted so FTS5 operators and
+    punctuation in user input are treated as plain text.
+    """
+    quoted = []
+    for term in terms:
+        term = term.strip()
+        if term:
+            quoted.append('"%s"*' % term.replace('"', '""'))
+    return " AND ".join(quoted)
+
+
+class QuestionSearchFilter(filters.SearchFilter):
+    """?search= through the FTS5 index, best matches first"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not fts_enabled(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        expression = match_expression(terms)
+        if not expression:
+            return queryset.none()
+        question_table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f"{FTS_TABLE}.rowid = {question_table}.id",
+                f"{FTS_TABLE} MATCH %s",
+            ],
+            params=[expression],
+            select={"search_rank": f"bm25({FTS_TABLE})"},
+            order_by=["search_rank", f"-{question_table}.id"],
+        )
@@ -1,7 +1,11 @@
 import json
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Question, Choice, QuestionImage
+from .models import Question, Choice, QuestionImage, ImportJob
 from exam.models import QuestionStat
+from .media import InvalidImage, save_question_image
+from .versions import bump_after_commit
 
 
 class ChoiceSerializer(serializers.ModelSerializer):
@@ -11,9 +15,25 @@ class ChoiceSerializer(serializers.ModelSerializer):
 
 
 class QuestionImageSerializer(serializers.ModelSerializer):
+    # image = 缩放后的展示图（旧图没有缩略图时退回原图），original 为原始上传
+    image = serializers.SerializerMethodField()
+    webp = serializers.ImageField(read_only=True)
+    original = serializers.ImageField(source="image", read_only=True)
+
     class Meta:
         model = QuestionImage
-        fields = ["id", "image"]
+        fields = ["id", "image", "webp", "original"]
+
+    def get_image(self, obj):
+        field = serializers.ImageField()
+        field._context = self.context
+        return field.to_representation(obj.display or obj.image)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if not instance.webp:
+            data["webp"] = None
+        return data
 
 
 class QuestionSerializer(serializers.ModelSerializer):
@@ -47,26 +67,90 @@ class QuestionSerializer(serializers.ModelSerializer):
             return round(stat.correct_count / stat.attempts_count, 3)  # 保留3位小数
         return None
 
-    def create(self, validated_data):
-        # 处理 choices_json
-        choices_raw = validated_data.pop("choices_json")
+    @staticmethod
+    def _parse_choices(choices_raw):
+        """choices_json -> [{"id": int|None, "text": str, "is_correct": bool}, ...]"""
         try:
             choices_data = json.loads(choices_raw)
         except Exception:
             raise serializers.ValidationError({"choices": "Invalid JSON format"})
+        if not isinstance(choices_data, list) or not all(
+            isinstance(c, dict) and isinstance(c.get("text"), str) for c in choices_data
+        ):
+            raise serializers.ValidationError({"choices": "Expected a list of {text, is_correct}"})
+        return [
+            {"id": c.get("id"), "text": c["text"], "is_correct": bool(c.get("is_correct", False))}
+            for c in choices_data
+        ]
+
+    def _sync_choices(self, question, choices_data):
+        """
+        按 id 对齐已有选项：改动的 bulk_update，新的 bulk_create，只删除被移除的。
+        没带 id 的按原文匹配一个尚未对上的旧选项，这样旧前端整表提交时 ChoiceStat 也能保留。
+        """
+        existing = {c.id: c for c in question.choices.all()}
+        unknown = [c["id"] for c in choices_data if c["id"] is not None and c["id"] not in existing]
+        if unknown:
+            raise serializers.ValidationError(
+                {"choices": f"Choices {unknown} do not belong to this question"}
+            )
+
+        kept = {c["id"] for c in choices_data if c["id"] is not None}
+        by_text = {}
+        for choice in existing.values():
+            if choice.id not in kept:
+                by_text.setdefault(choice.text, []).append(choice)
+
+        to_update, to_create = [], []
+        for data in choices_data:
+            if data["id"] is not None:
+                choice = existing[data["id"]]
+            elif by_text.get(data["text"]):
+                choice = by_text[data["text"]].pop(0)
+                kept.add(choice.id)
+            else:
+                to_create.append(Choice(question=question, text=data["text"], is_correct=data["is_correct"]))
+                continue
+            if (choice.text, choice.is_correct) != (data["text"], data["is_correct"]):
+                choice.text, choice.is_correct = data["text"], data["is_correct"]
+                to_update.append(choice)
+
+        removed = [cid for cid in existing if cid not in kept]
+        if removed:
+            Choice.objects.filter(id__in=removed).delete()
+        if to_update:
+            Choice.objects.bulk_update(to_update, ["text", "is_correct"])
+        if to_create:
+            Choice.objects.bulk_create(to_create)
+        if removed or to_update or to_create:
+            # bulk 操作不触发 Choice 的信号，答案键等缓存靠题库版本失效
+            bump_after_commit()
+
+    @staticmethod
+    def _save_image(question, uploaded_file):
+        try:
+            save_question_image(question, uploaded_file)
+        except InvalidImage:
+            raise serializers.ValidationError({"image": "Upload a valid image."})
+
+    def create(self, validated_data):
+        # 处理 choices_json
+        choices_data = self._parse_choices(validated_data.pop("choices_json"))
 
         request = self.context.get("request")
-        question = Question.objects.create(**validated_data)
+        with transaction.atomic():
+            question = Question.objects.create(**validated_data)
 
-        # 保存 choices
-        for choice in choices_data:
-            Choice.objects.create(question=question, **choice)
+            # 保存 choices（一次 bulk_create）
+            Choice.objects.bulk_create([
+                Choice(question=question, text=c["text"], is_correct=c["is_correct"])
+                for c in choices_data
+            ])
+            bump_after_commit()
 
-        # 保存单图
-        if request and "image" in request.FILES:
-            QuestionImage.objects.create(
-                question=question, image=request.FILES["image"]
-            )
+            # 保存单图（原图 + 缩放图 + WebP）
+            if request and "image" in request.FILES:
+                self._save_image(question, request.FILES["image"])
 
         return question
 
@@ -74,42 +158,90 @@ class QuestionSerializer(serializers.ModelSerializer):
         choices_raw = validated_data.pop("choices_json", None)
         request = self.context.get("request")
 
-        # 更新基础字段
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        # 更新 choices
-        if choices_raw:
-            try:
-                choices_data = json.loads(choices_raw)
-            except Exception:
-                raise serializers.ValidationError({"choices": "Invalid JSON format"})
-
-            instance.choices.all().delete()
-            for choice in choices_data:
-                Choice.objects.create(question=instance, **choice)
-
-        # 更新 image
-        if request and "image" in request.FILES:
-            if hasattr(instance, "image"):
-                instance.image.delete()
-            QuestionImage.objects.update_or_create(
-                question=instance, defaults={"image": request.FILES["image"]}
-            )
+        with transaction.atomic():
+            # 更新基础字段
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+
+            # 更新 choices：按 id 增量对齐，未改动的选项（及其 ChoiceStat）保持不变
+            if choices_raw:
+                self._sync_choices(instance, self._parse_choices(choices_raw))
+
+            # 更新 image
+            if request and "image" in request.FILES:
+                self._save_image(instance, request.FILES["image"])
 
         return instance
 
 
+class QuestionListSerializer(serializers.ModelSerializer):
+    """
+    列表页用的只读序列化：输出与 QuestionSerializer 相同，
+    choices 直接从预取结果拼 dict，不为每个选项实例化嵌套 serializer
+    """
+    choices = serializers.SerializerMethodField()
+    image = QuestionImageSerializer(read_only=True)
+    accuracy = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Question
+        fields = [
+            "id",
+            "name",
+            "type",
+            "level",
+            "category",
+            "marks",
+            "question_text",
+            "choices",
+            "image",
+            "accuracy",
+        ]
+        read_only_fields = fields
+
+    def get_choices(self, obj):
+        return [
+            {"id": c.id, "text": c.text, "is_correct": c.is_correct}
+            for c in obj.choices.all()
+        ]
+
+    get_accuracy = QuestionSerializer.get_accuracy
+
+
 class ChoicePreviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Choice
         fields = ["id", "text"]  # ❌ 不要返回 is_correct
 
 
+class QuestionImagePreviewSerializer(QuestionImageSerializer):
+    class Meta(QuestionImageSerializer.Meta):
+        fields = ["image", "webp"]  # 学生端只给缩放图
+
+
 class QuestionPreviewSerializer(serializers.ModelSerializer):
     choices = ChoicePreviewSerializer(many=True, read_only=True)
+    image = QuestionImagePreviewSerializer(read_only=True)
 
     class Meta:
         model = Question
-        fields = ["id", "question_text", "type", "marks", "choices"]
+        fields = ["id", "question_text", "type", "marks", "choices", "image"]
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            "id", "file_name", "status", "batch_size",
+            "rows", "imported", "failed", "errors", "detail",
+            "rows_per_second", "created_at", "started_at", "finished_at",
+        ]
+
+    def get_rows_per_second(self, obj):
+        if not obj.started_at:
+            return None
+        elapsed = ((obj.finished_at or timezone.now()) - obj.started_at).total_seconds()
+        return round(obj.rows / elapsed, 1) if elapsed > 0 else None
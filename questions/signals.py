@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import search
+from .models import Question, Choice, QuestionImage
+from .versions import QUESTION_IMAGES, QUESTION_POOL, bump_after_commit
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def bump_question_bank_version(sender, **kwargs):
+    bump_after_commit()
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def bump_question_pool_version(sender, **kwargs):
+    bump_after_commit(QUESTION_POOL)
+
+
+@receiver(post_save, sender=QuestionImage)
+@receiver(post_delete, sender=QuestionImage)
+def bump_question_images_version(sender, **kwargs):
+    bump_after_commit(QUESTION_IMAGES)
+
+
+@receiver(post_save, sender=Question)
+def index_question_text(sender, instance, **kwargs):
+    search.index_questions([instance])
+
+
+@receiver(post_delete, sender=Question)
+def unindex_question_text(sender, instance, **kwargs):
+    search.unindex_questions([instance.id])
@@ -1,3 +1,472 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from exam.models import ChoiceStat, QuestionStat
+from testpaper.models import TestPaper
+from user.models import User
+from user_auth.authentications import generate_jwt_token
+from . import search
+from .checks import check_shared_cache
+from .models import Choice, ImportJob, Question, QuestionImage
+from .versions import get_version
+
+
+def make_questions(n, start=0):
+    questions = Question.objects.bulk_create([
+        Question(name=f"Q{i}", type="Single Choice", level="Level 1",
+                 category="Grammar", marks=1, question_text=f"Question {i}")
+        for i in range(start, start + n)
+    ])
+    Choice.objects.bulk_create([
+        Choice(question=q, text=text, is_correct=text == "right")
+        for q in questions for text in ("wrong", "right", "other")
+    ])
+    QuestionStat.objects.bulk_create([
+        QuestionStat(question=q, attempts_count=4, correct_count=3) for q in questions[::2]
+    ])
+    QuestionImage.objects.bulk_create([
+        QuestionImage(question=q, image=f"question_images/{q.id}.png") for q in questions[::3]
+    ])
+    return questions
+
+
+class AuthedTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_superuser(first_name="Admin", email="admin@example.com")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"JWT {generate_jwt_token(user.uid)}"
+
+
+class QuestionListQueryTests(AuthedTestCase):
+
+    def test_page_query_count_is_constant(self):
+        make_questions(10)
+        # 登录中间件查用户 + count + 当前页 + 预取 choices
+        with self.assertNumQueries(4):
+            small = self.client.get("/questions/").json()
+        make_questions(90, start=10)
+        with self.assertNumQueries(4):
+            full = self.client.get("/questions/").json()
+        self.assertEqual(small["count"], 10)
+        self.assertEqual(len(full["results"]), 100)
+
+    def test_list_matches_detail(self):
+        q = make_questions(3)[0]
+        listed = {row["id"]: row for row in self.client.get("/questions/").json()["results"]}
+        with self.assertNumQueries(3):
+            detail = self.client.get(f"/questions/{q.id}/").json()
+        self.assertEqual(listed[q.id], detail)
+        self.assertEqual(detail["accuracy"], 0.75)
+        self.assertEqual([c["text"] for c in detail["choices"]], ["wrong", "right", "other"])
+        self.assertTrue(detail["image"]["image"].endswith(f"{q.id}.png"))
+
+
+class SearchTests(AuthedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        texts = [
+            ("Past tense", "Choose the past tense of go"),
+            ("Irregular verbs", "Past tense: go, went, gone. Which is the past participle of go?"),
+            ("Articles", "Fill in the article: ___ apple"),
+        ]
+        self.questions = [
+            Question.objects.create(name=name, type="Single Choice", level="Level 1",
+                                    category="Grammar", marks=1, question_text=text)
+            for name, text in texts
+        ]
+
+    def search(self, term):
+        return [row["id"] for row in self.client.get("/questions/", {"search": term}).json()["results"]]
+
+    def test_ranked_by_relevance(self):
+        past, irregular, articles = self.questions
+        self.assertEqual(self.search("past go"), [irregular.id, past.id])
+        self.assertEqual(self.search("artic"), [articles.id])
+        # FTS5 operators and quotes in user input are matched as plain text
+        self.assertEqual(sorted(self.search('"tense"')), [past.id, irregular.id])
+        self.assertEqual(self.search("tense NOT"), [])
+
+    def test_index_follows_signals_and_rebuild(self):
+        past, irregular, articles = self.questions
+        articles.question_text = "Pick the past form"
+        articles.save()
+        irregular.delete()
+        self.assertEqual(sorted(self.search("past")), [past.id, articles.id])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self.search("past"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(sorted(self.search("past")), [past.id, articles.id])
+
+
+CSV_HEADER = "name,type,level,category,marks,question,choices,correctIndex\n"
+
+
+class ImportCSVTests(AuthedTestCase):
+
+    def upload(self, body, **data):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        f = SimpleUploadedFile("bank.csv", body, content_type="text/csv")
+        return self.client.post("/questions/import_csv/", {"file": f, **data})
+
+    def test_chunked_import_with_row_errors(self):
+        body = CSV_HEADER + (
+            "Q1,Single Choice,Level 1,Grammar,2,Past of go?,goed|went,1\n"
+            "Q2,Single Choice,Level 9,Grammar,2,Bad level,a|b,0\n"
+            "Q3,Multiple Choice,Level 2,Vocabulary,x,Bad marks,a|b,0\n"
+            "Q4,Single Choice,Level 1,Grammar,1,Bad index,a|b,5\n"
+            '"Q5, quoted",Multiple Choice,Level 2,Vocabulary,3,"Pick, two",a|b|c,"0,2"\n'
+            "Q6,Single Choice,Level 3,Grammar,1,Last one,yes|no,0\n"
+        )
+        resp = self.upload(body, batch_size=1)
+        self.assertEqual(resp.status_code, 201)
+        report = resp.json()
+        self.assertEqual((report["rows"], report["imported"], report["failed"]), (6, 3, 3))
+        self.assertEqual([e["line"] for e in report["errors"]], [3, 4, 5])
+        self.assertIn("unknown level 'Level 9'", report["errors"][0]["errors"])
+
+        q5 = Question.objects.get(name="Q5, quoted")
+        self.assertEqual([(c.text, c.is_correct) for c in q5.choices.order_by("id")],
+                         [("a", True), ("b", False), ("c", True)])
+        # bulk 导入的题目也进了搜索索引
+        ids = [r["id"] for r in self.client.get("/questions/", {"search": "quoted"}).json()["results"]]
+        self.assertEqual(ids, [q5.id])
+
+    def test_commits_per_chunk_and_rejects_bad_header(self):
+        rows = "".join(f"Q{i},Single Choice,Level 1,Grammar,1,Text {i},a|b,0\n" for i in range(5))
+        body = (CSV_HEADER + rows).encode() + b"\xff\xfe broken\n"
+        report = self.upload(body, batch_size=2).json()
+        # 已提交的分块保留，坏字节之后停止并报告
+        self.assertEqual(report["imported"], 5)
+        self.assertIn("unreadable input", report["errors"][0]["errors"][0])
+        self.assertEqual(Question.objects.count(), 5)
+
+        resp = self.upload("name,type\nQ,Single Choice\n")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("Missing columns", resp.json()["error"])
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(prefix="import-media-"),
+    QUESTION_IMPORT_SPOOL_ROOT=tempfile.mkdtemp(prefix="import-jobs-"),
+)
+class ImportJobTests(AuthedTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(settings.QUESTION_IMPORT_SPOOL_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_large_upload_is_queued_and_ingested(self):
+        rows = "".join(f"Q{i},Single Choice,Level 1,Grammar,1,Text {i},a|b,0\n" for i in range(30))
+        body = (CSV_HEADER + rows + "Bad,Single Choice,Level 1,Grammar,0,x,a|b,0\n").encode()
+        f = SimpleUploadedFile("bank.csv", body, content_type="text/csv")
+        with self.settings(QUESTION_IMPORT_ASYNC_BYTES=100):
+            resp = self.client.post("/questions/import_csv/", {"file": f, "batch_size": 10})
+        self.assertEqual(resp.status_code, 202)
+        job_id = resp.json()["job"]["id"]
+        self.assertEqual(Question.objects.count(), 0)
+
+        job = ImportJob.objects.get(id=job_id)
+        self.assertEqual(job.status, "queued")
+        self.assertTrue(os.path.exists(job.file.path))
+        # 排队中的 CSV 含答案，不能落在 MEDIA_ROOT 下
+        self.assertTrue(job.file.path.startswith(str(settings.QUESTION_IMPORT_SPOOL_ROOT)))
+        self.assertEqual(os.listdir(settings.MEDIA_ROOT), [])
+
+        call_command("run_import_jobs", stdout=StringIO())
+        data = self.client.get(f"/questions/import-jobs/{job_id}/").json()
+        self.assertEqual((data["status"], data["rows"], data["imported"], data["failed"]),
+                         ("done", 31, 30, 1))
+        self.assertEqual(data["errors"][0]["line"], 32)
+        self.assertIsNotNone(data["rows_per_second"])
+        self.assertEqual(Question.objects.count(), 30)
+        self.assertFalse(os.path.exists(job.file.path))
+
+    def test_stale_running_job_is_requeued_and_resumed(self):
+        rows = "".join(f"Q{i},Single Choice,Level 1,Grammar,1,Text {i},a|b,0\n" for i in range(30))
+        f = SimpleUploadedFile("bank.csv", (CSV_HEADER + rows).encode(), content_type="text/csv")
+        job_id = self.client.post("/questions/import_csv/?async=1", {"file": f, "batch_size": 10}).json()["job"]["id"]
+        # 模拟提交完第一个分块后 worker 挂掉
+        started = timezone.now() - timedelta(hours=1)
+        ImportJob.objects.filter(id=job_id).update(
+            status="running", started_at=started, heartbeat_at=started, rows=10, imported=10,
+        )
+        with self.settings(QUESTION_IMPORT_STALE_SECONDS=3600 * 2):
+            call_command("run_import_jobs", stdout=StringIO())
+        self.assertEqual(ImportJob.objects.get(id=job_id).status, "running")
+
+        call_command("run_import_jobs", stdout=StringIO())
+        job = ImportJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.rows, job.imported, job.started_at), ("done", 30, 30, started))
+        # 前 10 行已在上次提交，不会重复导入
+        self.assertEqual(sorted(Question.objects.values_list("name", flat=True)),
+                         sorted(f"Q{i}" for i in range(10, 30)))
+
+    def test_bad_file_fails_job(self):
+        f = SimpleUploadedFile("bank.csv", b"name,type\nQ,Single Choice\n", content_type="text/csv")
+        job_id = self.client.post("/questions/import_csv/?async=1", {"file": f}).json()["job"]["id"]
+        call_command("run_import_jobs", stdout=StringIO())
+        data = self.client.get(f"/questions/import-jobs/{job_id}/").json()
+        self.assertEqual(data["status"], "failed")
+        self.assertIn("Missing columns", data["detail"])
+        self.assertEqual(self.client.get("/questions/import-jobs/999/").status_code, 404)
+
+
+class ExportTests(AuthedTestCase):
+
+    def test_csv_round_trips_through_import(self):
+        make_questions(5)
+        q = Question.objects.create(name='Quote "this", please', type="Multiple Choice", level="Level 2",
+                                    category="Vocabulary", marks=3, question_text="Line one\nline two")
+        Choice.objects.bulk_create([Choice(question=q, text="a, b", is_correct=True),
+                                    Choice(question=q, text="ü", is_correct=True)])
+        original = [
+            (q.name, q.type, q.level, q.category, q.marks, q.question_text,
+             [(c.text, c.is_correct) for c in q.choices.order_by("id")])
+            for q in Question.objects.order_by("id")
+        ]
+
+        with self.assertNumQueries(3):  # 用户 + 题目 + 预取 choices（一个分块）
+            resp = self.client.get("/questions/export/")
+            body = b"".join(resp.streaming_content)
+        self.assertEqual(resp["Content-Type"], "text/csv; charset=utf-8")
+
+        Question.objects.all().delete()
+        report = self.client.post("/questions/import_csv/", {
+            "file": SimpleUploadedFile("bank.csv", body, content_type="text/csv"),
+        }).json()
+        self.assertEqual(report["failed"], 0)
+        imported = [
+            (q.name, q.type, q.level, q.category, q.marks, q.question_text,
+             [(c.text, c.is_correct) for c in q.choices.order_by("id")])
+            for q in Question.objects.order_by("id")
+        ]
+        self.assertEqual(imported, original)
+
+    def test_ndjson_with_filters(self):
+        make_questions(3)
+        Question.objects.create(name="Other", type="Single Choice", level="Level 3",
+                                category="Grammar", marks=1, question_text="x")
+        resp = self.client.get("/questions/export/", {"fmt": "ndjson", "level": "Level 1"})
+        rows = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([c["text"] for c in rows[0]["choices"]], ["wrong", "right", "other"])
+        self.assertEqual(self.client.get("/questions/export/", {"fmt": "xml"}).status_code, 400)
+
+
+class ChoiceSyncTests(AuthedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.question = make_questions(1)[0]
+        self.wrong, self.right, self.other = self.question.choices.order_by("id")
+        ChoiceStat.objects.bulk_create([ChoiceStat(choice=c, selected_count=5) for c in (self.wrong, self.right, self.other)])
+
+    def put(self, choices, **fields):
+        data = {"name": "Q", "type": "Single Choice", "level": "Level 1", "category": "Grammar",
+                "marks": 1, "question_text": "T", "choices_json": json.dumps(choices), **fields}
+        return self.client.put(f"/questions/{self.question.id}/", data, content_type="application/json")
+
+    def test_update_by_id_keeps_untouched_choices(self):
+        version = get_version()
+        resp = self.put([
+            {"id": self.wrong.id, "text": "wrong", "is_correct": False},
+            {"id": self.right.id, "text": "right!", "is_correct": True},
+            {"text": "new", "is_correct": False},
+        ])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([c["text"] for c in resp.json()["choices"]], ["wrong", "right!", "new"])
+        self.assertNotEqual(get_version(), version)
+
+        choices = list(self.question.choices.order_by("id"))
+        self.assertEqual([c.id for c in choices[:2]], [self.wrong.id, self.right.id])
+        self.assertFalse(Choice.objects.filter(id=self.other.id).exists())
+        self.assertEqual(ChoiceStat.objects.filter(choice__question=self.question).count(), 2)
+
+    def test_update_without_ids_matches_by_text(self):
+        self.put([{"text": "right", "is_correct": True}, {"text": "wrong", "is_correct": False}])
+        self.assertEqual(sorted(self.question.choices.values_list("id", flat=True)),
+                         [self.wrong.id, self.right.id])
+
+    def test_rejects_foreign_choice_id(self):
+        foreign = make_questions(1, start=1)[0].choices.first()
+        resp = self.put([{"id": foreign.id, "text": "x", "is_correct": True}])
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.question.choices.count(), 3)
+
+    def test_create_bulk_creates_choices(self):
+        data = {"name": "N", "type": "Single Choice", "level": "Level 1", "category": "Grammar",
+                "marks": 1, "question_text": "T",
+                "choices_json": json.dumps([{"text": "a", "is_correct": True}, {"text": "b"}])}
+        resp = self.client.post("/questions/", data, content_type="application/json")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([(c["text"], c["is_correct"]) for c in resp.json()["choices"]],
+                         [("a", True), ("b", False)])
+
+
+def png_bytes(size=(2000, 1000), color=(200, 30, 30)):
+    out = BytesIO()
+    Image.new("RGB", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="question-media-"))
+class MediaPipelineTests(AuthedTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_question(self, image_bytes, name="photo.png"):
+        return self.client.post("/questions/", {
+            "name": "Q", "type": "Single Choice", "level": "Level 1", "category": "Grammar",
+            "marks": 1, "question_text": "T",
+            "choices_json": json.dumps([{"text": "a", "is_correct": True}]),
+            "image": SimpleUploadedFile(name, image_bytes, content_type="image/png"),
+        })
+
+    def test_upload_makes_hashed_renditions(self):
+        resp = self.create_question(png_bytes())
+        self.assertEqual(resp.status_code, 201)
+        image = QuestionImage.objects.get(question_id=resp.json()["id"])
+        self.assertRegex(image.image.name, r"question_images/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+        self.assertTrue(image.display.name.endswith("_1280.jpg"))
+        with Image.open(image.webp.path) as webp:
+            self.assertEqual((webp.format, webp.size), ("WEBP", (1280, 640)))
+        self.assertTrue(resp.json()["image"]["image"].endswith(image.display.name))
+
+        # 相同内容的上传复用同一组文件
+        again = QuestionImage.objects.get(question_id=self.create_question(png_bytes(), "copy.png").json()["id"])
+        self.assertEqual((again.image.name, again.webp.name), (image.image.name, image.webp.name))
+
+        self.assertEqual(self.create_question(b"not an image").status_code, 400)
+
+    def test_serving_headers(self):
+        self.create_question(png_bytes())
+        image = QuestionImage.objects.get()
+        url = "/media/" + image.webp.name
+        resp = self.client.get(url)
+        body = b"".join(resp.streaming_content)
+        self.assertEqual(resp["Content-Type"], "image/webp")
+        self.assertIn("immutable", resp["Cache-Control"])
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+        part = self.client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(b"".join(part.streaming_content), body[10:20])
+        self.assertEqual(part["Content-Range"], f"bytes 10-19/{len(body)}")
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f"bytes={len(body)}-").status_code, 416)
+        self.assertEqual(self.client.get("/media/../settings/settings.py").status_code, 404)
+        # MEDIA_ROOT 下题图以外的文件不对外
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "question_imports"), exist_ok=True)
+        with open(os.path.join(settings.MEDIA_ROOT, "question_imports", "bank.csv"), "w") as f:
+            f.write("secret")
+        self.client.defaults.pop("HTTP_AUTHORIZATION")
+        self.assertNotEqual(self.client.get("/media/question_imports/bank.csv").status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with self.settings(MEDIA_SENDFILE_MODE="x-accel-redirect"):
+            resp = self.client.get(url)
+        self.assertEqual(resp["X-Accel-Redirect"], "/protected-media/" + image.webp.name)
+        self.assertEqual(resp.content, b"")
+
+
+class CursorPaginationTests(AuthedTestCase):
+
+    def test_cursor_walk_without_count(self):
+        make_questions(250)
+        seen = []
+        url, params = "/questions/", {"pagination": "cursor"}
+        while url:
+            with self.assertNumQueries(3):  # 用户 + 当前页 + 预取 choices，没有 COUNT
+                data = self.client.get(url, params).json()
+            self.assertNotIn("count", data)
+            seen.extend(row["id"] for row in data["results"])
+            url, params = data["next"], None
+        expected = list(Question.objects.order_by("-created_at", "id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+        # 默认仍是页码分页
+        self.assertEqual(self.client.get("/questions/").json()["count"], 250)
+
+    def test_approximate_count_header(self):
+        make_questions(5)
+        resp = self.client.get("/questions/", {"pagination": "cursor", "approx_count": 1})
+        self.assertEqual(resp["X-Approximate-Count"], "5")
+        resp = self.client.get("/questions/", {"pagination": "cursor", "approx_count": 1, "level": "Level 2"})
+        self.assertEqual(resp["X-Approximate-Count"], "0")
+        self.assertNotIn("X-Approximate-Count", self.client.get("/questions/"))
+
+
+class ConditionalGetTests(AuthedTestCase):
+
+    def get(self, url, etag=None, **params):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, params, **headers)
+
+    def test_questions_304_until_something_changes(self):
+        q = make_questions(3)[0]
+        etag = self.get("/questions/")["ETag"]
+        with self.assertNumQueries(1):  # 只剩登录中间件查用户
+            resp = self.get("/questions/", etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.get("/questions/", etag, level="Level 1").status_code, 200)
+
+        choice = q.choices.first()
+        choice.text = "changed"
+        choice.save()
+        resp = self.get("/questions/", etag)
+        self.assertEqual(resp.status_code, 200)
+
+        etag = resp["ETag"]
+        QuestionStat.bulk_bump({q.id: (1, 1, 0)})
+        self.assertEqual(self.get("/questions/", etag).status_code, 200)
+
+        detail = self.get(f"/questions/{q.id}/")
+        self.assertEqual(self.get(f"/questions/{q.id}/", detail["ETag"]).status_code, 304)
+
+    def test_test_papers_follow_m2m_changes(self):
+        q1, q2 = make_questions(2)
+        paper = TestPaper.objects.create(title="P")
+        paper.questions.add(q1)
+        etag = self.get("/test-papers/")["ETag"]
+        self.assertEqual(self.get("/test-papers/", etag).status_code, 304)
+        q2.test_papers.add(paper)
+        self.assertEqual(self.get("/test-papers/", etag).status_code, 200)
+
+    def test_no_etag_without_a_shared_cache(self):
+        make_questions(2)
+        etag = self.get("/questions/")["ETag"]
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            resp = self.get("/questions/", etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("ETag", resp)
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def test_process_local_cache_is_rejected(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertEqual([e.id for e in check_shared_cache(None)], ["questions.E001"])
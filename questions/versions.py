@@ -0,0 +1,65 @@
+"""
+Change-version stamps for the question bank, stored in the Django cache.
+
+Anything derived from questions/choices (answer keys, generation pools, ...)
+embeds the current version in its cache key, so bumping the version makes
+every stale entry unreachable without having to find and delete it.
+
+The stamps only work when every process (web workers, fold_stats,
+run_import_jobs, ...) reads the same cache, see cache_is_shared().
+"""
+import time
+
+from django.core.cache import cache, caches
+from django.db import transaction
+
+QUESTION_BANK = "question_bank"  # any question/choice change
+QUESTION_POOL = "question_pool"  # question rows added/removed or id/level/category/marks changed
+QUESTION_IMAGES = "question_images"  # QuestionImage rows
+QUESTION_STATS = "question_stats"  # QuestionStat counters (folded submissions, regrades)
+TEST_PAPERS = "test_papers"  # TestPaper rows and their question lists
+
+# backends whose data lives in (and dies with) a single process
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def cache_is_shared(alias="default"):
+    backend = type(caches[alias])
+    return f"{backend.__module__}.{backend.__qualname__}" not in PROCESS_LOCAL_BACKENDS
+
+
+def _cache_key(name):
+    return f"version:{name}"
+
+
+def get_version(name=QUESTION_BANK):
+    key = _cache_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Seed with a timestamp so a flushed cache never reuses an old version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(name=QUESTION_BANK):
+    key = _cache_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+        return cache.get(key, 0)
+
+
+def bump_after_commit(name=QUESTION_BANK):
+    """
+    Bump now and once more when the surrounding transaction commits, so a
+    reader that saw the new version before the commit (and cached the old
+    rows under it) is invalidated again.
+    """
+    bump_version(name)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_version(name))
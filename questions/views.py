@@ -1,25 +1,63 @@
 from rest_framework import viewsets
-import csv, io
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Question, Choice
-from .serializers import QuestionSerializer
+from .models import Question, Choice, ImportJob
+from .serializers import QuestionSerializer, QuestionListSerializer, ImportJobSerializer
+from .importer import QuestionCSVImporter, ImportFormatError, DEFAULT_BATCH_SIZE
+from .exporter import csv_lines, ndjson_lines
+from .etags import VersionETagMixin
+from .search import QuestionSearchFilter
+from .versions import QUESTION_BANK, QUESTION_IMAGES, QUESTION_STATS
 from rest_framework import viewsets, filters
 from django_filters.rest_framework import DjangoFilterBackend
 
+EXPORT_FORMATS = {
+    "csv": (csv_lines, "text/csv; charset=utf-8"),
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+}
 
 
 
-class QuestionViewSet(viewsets.ModelViewSet):
-    queryset = Question.objects.all().select_related("stat")
+class QuestionViewSet(VersionETagMixin, viewsets.ModelViewSet):
+    # stat / image are one-to-one (joined), choices are prefetched in one query per page
+    queryset = (
+        Question.objects.all()
+        .select_related("stat", "image")
+        .prefetch_related(
+            Prefetch("choices", queryset=Choice.objects.order_by("id"))
+        )
+    )
     serializer_class = QuestionSerializer
+    # list / retrieve answer If-None-Match with 304 until one of these changes
+    etag_versions = (QUESTION_BANK, QUESTION_IMAGES, QUESTION_STATS)
 
-    # ✅ 支持 search / filter
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
+    # ✅ 支持 search / filter（search 在 SQLite 上走 FTS5 索引，按相关度排序）
+    filter_backends = [QuestionSearchFilter, DjangoFilterBackend]
     search_fields = ["name", "question_text"]
     filterset_fields = ["category", "level"]
 
+    # columns the list page actually renders (+ created_at for cursor pagination); other stat counters are skipped
+    list_only_fields = [
+        "id", "name", "type", "level", "category", "marks", "question_text", "created_at",
+        "stat__correct_count", "stat__attempts_count",
+        "image__image", "image__display", "image__webp",
+    ]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = queryset.only(*self.list_only_fields)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return QuestionListSerializer
+        return super().get_serializer_class()
 
     @action(detail=False, methods=["post"])
     def import_csv(self, request):
@@ -27,44 +65,59 @@ class QuestionViewSet(viewsets.ModelViewSet):
         Bulk import questions from CSV.
         Expected CSV header:
         name,type,level,category,marks,question,choices,correctIndex
+
+        The file is streamed and committed every `batch_size` rows (form field,
+        default 1000); invalid rows are skipped and listed in the response.
+        Uploads above QUESTION_IMPORT_ASYNC_BYTES, or with ?async=1, are queued
+        as an ImportJob and answered with 202 right away.
         """
         file = request.FILES.get("file")
         if not file:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch_size = int(request.data.get("batch_size") or DEFAULT_BATCH_SIZE)
+        except (TypeError, ValueError):
+            return Response({"error": "batch_size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
 
-        decoded_file = file.read().decode("utf-8")
-        io_string = io.StringIO(decoded_file)
-        reader = csv.DictReader(io_string)
-
-        questions_to_create = []
-        choices_to_create = []
-
-        for row in reader:
-            q = Question(
-                name=row["name"],
-                type=row["type"],
-                level=row["level"],
-                category=row["category"],
-                marks=int(row["marks"]),
-                question_text=row["question"],
+        # large files (or ?async=1) become a job for run_import_jobs; poll import-jobs/{id}/
+        run_async = request.query_params.get("async") in ("1", "true") or (
+            file.size > settings.QUESTION_IMPORT_ASYNC_BYTES
+        )
+        if run_async:
+            job = ImportJob.objects.create(file=file, file_name=file.name, batch_size=batch_size)
+            return Response(
+                {"message": "Import queued", "job": ImportJobSerializer(job).data},
+                status=status.HTTP_202_ACCEPTED,
             )
-            questions_to_create.append((q, row))
-
-        # 批量创建 Question
-        created_questions = Question.objects.bulk_create([q for q, _ in questions_to_create])
-
-        # 批量创建 Choice
-        for q, row in zip(created_questions, [r for _, r in questions_to_create]):
-            choices = row["choices"].split("|")
-            correct_indexes = [int(x) for x in row["correctIndex"].split(",")]
-            for i, text in enumerate(choices):
-                choices_to_create.append(
-                    Choice(question=q, text=text.strip(), is_correct=i in correct_indexes)
-                )
 
-        Choice.objects.bulk_create(choices_to_create)
+        try:
+            report = QuestionCSVImporter(batch_size=batch_size).run(file)
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(
-            {"message": f"Imported {len(created_questions)} questions"},
+            {"message": f"Imported {report['imported']} questions", **report},
             status=status.HTTP_201_CREATED,
-        )
\ No newline at end of file
+        )
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream the whole bank (search / category / level filters apply).
+        ?fmt=csv (default, same columns as import_csv) or ?fmt=ndjson
+        """
+        fmt = request.query_params.get("fmt", "csv")
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": "fmt must be csv or ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+        lines, content_type = EXPORT_FORMATS[fmt]
+
+        queryset = self.filter_queryset(Question.objects.all())
+        response = StreamingHttpResponse(lines(queryset), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="questions.{fmt}"'
+        return response
+
+    @action(detail=False, methods=["get"], url_path=r"import-jobs/(?P<job_id>[0-9]+)")
+    def import_job(self, request, job_id=None):
+        """Progress of a queued CSV import: rows processed, errors, rows/second"""
+        job = get_object_or_404(ImportJob, id=job_id)
+        return Response(ImportJobSerializer(job).data)
@@ -0,0 +1,97 @@
+"""
+Project-wide pagination (REST_FRAMEWORK["DEFAULT_PAGINATION_CLASS"]).
+
+Page-number pagination stays the default. Clients opt in to keyset (cursor)
+pagination with ``?pagination=cursor`` and then follow the ``next`` /
+``previous`` links (``?cursor=...``): no COUNT(*) and no OFFSET scan, each
+page costs O(page size) via the (created_at, id) indexes. Views choose the
+ordering with ``cursor_ordering`` (default ``("-created_at", "id")``).
+
+``?approx_count=1`` adds an ``X-Approximate-Count`` header taken from the
+database's table statistics when the listing is unfiltered, otherwise from
+an exact count cached for a minute.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+DEFAULT_CURSOR_ORDERING = ("-created_at", "id")
+APPROX_COUNT_TIMEOUT = 60
+
+
+def _table_estimate(queryset):
+    """Row count from planner statistics (SQLite after ANALYZE, PostgreSQL); None if unknown"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == "sqlite":
+        sql = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1"
+    elif connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+def approximate_count(queryset):
+    queryset = queryset.order_by()
+    if not queryset.query.where:
+        estimate = _table_estimate(queryset)
+        if estimate is not None:
+            return estimate
+    key = "approx_count:" + hashlib.sha1(str(queryset.query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, APPROX_COUNT_TIMEOUT)
+    return count
+
+
+class KeysetPagination(CursorPagination):
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+
+class OptInCursorPagination(PageNumberPagination):
+    mode_query_param = "pagination"
+    approx_count_query_param = "approx_count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.approx_count = None
+        if request.query_params.get(self.approx_count_query_param) in ("1", "true"):
+            self.approx_count = approximate_count(queryset)
+
+        self.keyset = None
+        use_cursor = (
+            KeysetPagination.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == "cursor"
+        )
+        if not use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = KeysetPagination(
+            ordering=getattr(view, "cursor_ordering", DEFAULT_CURSOR_ORDERING),
+            page_size=self.get_page_size(request),
+        )
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            response = self.keyset.get_paginated_response(data)
+        else:
+            response = super().get_paginated_response(data)
+        if self.approx_count is not None:
+            response["X-Approximate-Count"] = str(self.approx_count)
+        return response
@@ -46,7 +46,7 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "settings.pagination.OptInCursorPagination",  # ?pagination=cursor for keyset paging
     "PAGE_SIZE": 100,  # 每页多少条（你可以改成前端 page_size 的值）
 }
 
@@ -75,6 +75,34 @@ DATABASES = {
 }
 
 
+# Cache
+# Version stamps (questions.versions), answer keys, autosave buffers and
+# generation pools live here and are shared by the web workers and the
+# management-command workers (fold_stats, fill_variant_pools, run_import_jobs),
+# so the backend must be shared between processes. Redis (REDIS_URL) is the
+# supported backend: the hot paths (exam start, autosave, 304s, student
+# payloads) are built on it never touching the database, and its incr/add are
+# atomic. CACHE_BACKEND=db is a slow fallback (every cache read and write is a
+# query; run createcachetable). Process-local backends fail check questions.E001.
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+if os.environ.get("CACHE_BACKEND") == "db":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -118,3 +146,26 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # custom
 AUTH_USER_MODEL = "user.User"
+
+# Autosave buffers are written to Attempt.draft_answers at most every N seconds
+EXAM_AUTOSAVE_FLUSH_SECONDS = 30
+
+# Pre-generated question variants kept per Published paper (fill_variant_pools)
+EXAM_VARIANT_POOL_SIZE = 50
+
+# CSV uploads larger than this are queued as ImportJobs (run_import_jobs) instead of imported in the request
+QUESTION_IMPORT_ASYNC_BYTES = 5 * 1024 * 1024
+# Where queued uploads wait for run_import_jobs; keep it outside MEDIA_ROOT (never served)
+QUESTION_IMPORT_SPOOL_ROOT = BASE_DIR / "private" / "question_imports"
+# A running import with no progress for this long is assumed dead and re-queued (it resumes
+# after the last committed chunk)
+QUESTION_IMPORT_STALE_SECONDS = 10 * 60
+
+# Question images: longest edge of the resized / WebP renditions made on upload
+QUESTION_IMAGE_MAX_EDGE = 1280
+
+# /media/ is served by questions.media.serve_media. Set to "x-accel-redirect" (nginx, internal
+# location at MEDIA_SENDFILE_PREFIX aliased to MEDIA_ROOT) or "x-sendfile" (Apache / lighttpd)
+# to hand the file body to the web server
+MEDIA_SENDFILE_MODE = None
+MEDIA_SENDFILE_PREFIX = "/protected-media/"
@@ -1,7 +1,7 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 
-from django.conf.urls.static import static
+from questions.media import UPLOAD_DIR, serve_media
 
 
 urlpatterns = [
@@ -13,4 +13,8 @@ urlpatterns = [
 
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# question images only, with ETag / Range / long-lived caching (and optional
+# X-Accel-Redirect / X-Sendfile); nothing else under MEDIA_ROOT is public
+urlpatterns += [
+    re_path(r"^%s(?P<path>%s/.+)$" % (settings.MEDIA_URL.lstrip("/"), UPLOAD_DIR), serve_media),
+]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0002_alter_student_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['-created_at', 'id'], name='student_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def backfill_created_at(apps, schema_editor):
+    # 0002 之前的学生没有 created_at：补成比最早已知时间更早，排在列表最后
+    Student = apps.get_model("students", "Student")
+    earliest = Student.objects.aggregate(first=Min("created_at"))["first"] or timezone.now()
+    Student.objects.filter(created_at__isnull=True).update(created_at=earliest - timedelta(seconds=1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0003_student_student_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='student',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -8,7 +8,10 @@ class Student(models.Model):
     name = models.CharField(max_length=120)
     student_no = models.CharField(max_length=64, unique=True, db_index=True)
     email = models.EmailField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True,blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["-created_at", "id"], name="student_created_id_idx")]
 
     def __str__(self):
         return f'{self.student_no} - {self.name}'
\ No newline at end of file
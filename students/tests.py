@@ -1,3 +1,40 @@
-from django.test import TestCase
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
 
-# Create your tests here.
+from user.models import User
+from user_auth.authentications import generate_jwt_token
+
+
+class CreatedAtBackfillTests(TransactionTestCase):
+    """0002 之前建的学生 created_at 为 NULL，游标分页会把它们漏掉"""
+
+    before = [("students", "0003_student_student_created_id_idx")]
+    after = [("students", "0004_student_created_at_not_null")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_null_created_at_is_backfilled_and_paged(self):
+        Student = self.migrate(self.before).get_model("students", "Student")
+        for no in ("S1", "S2", "S3"):
+            Student.objects.create(student_no=no, name=no)
+        Student.objects.filter(student_no="S2").update(created_at=None)
+
+        self.migrate(self.after)
+        user = User.objects.create_superuser(first_name="Admin", email="admin@example.com")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"JWT {generate_jwt_token(user.uid)}"
+        seen, url = [], "/students/?pagination=cursor"
+        while url:
+            page = self.client.get(url).json()
+            seen += [row["student_no"] for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(sorted(seen), ["S1", "S2", "S3"])
+        self.assertEqual(seen[-1], "S2")  # 补的时间早于所有已知学生，排在最后
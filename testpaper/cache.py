@@ -0,0 +1,105 @@
+# testpaper/cache.py
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from questions.versions import TEST_PAPERS, bump_after_commit, get_version
+from .generation import content_version, render_questions
+from .models import TestPaper
+from .serializers import TestPaperMetaSerializer
+
+SPEC_TIMEOUT = 60 * 60
+STUDENT_TIMEOUT = 24 * 60 * 60
+
+
+def _paper_version_name(paper_id):
+    return f"{TEST_PAPERS}:{paper_id}"
+
+
+def paper_version(paper_id):
+    """单张试卷的版本号（试卷字段或题目列表变了就 +1），存在共享缓存里，所有进程可见"""
+    return get_version(_paper_version_name(paper_id))
+
+
+def _spec_key(paper_id):
+    return f"testpaper:{paper_id}:{paper_version(paper_id)}:spec"
+
+
+def paper_spec(paper_id):
+    """
+    开考时需要的试卷信息 {"status": ..., "level_config": ..., "question_ids": [...]}，
+    命中缓存则不查库。
+    试卷不存在返回 None（只缓存“存在”，不缓存“不存在”）。
+    """
+    key = _spec_key(paper_id)
+    spec = cache.get(key)
+    if spec is not None:
+        return spec
+    paper = TestPaper.objects.filter(id=paper_id).only("id", "status", "level_config").first()
+    if paper is None:
+        return None
+    spec = {
+        "status": paper.status,
+        "level_config": paper.level_config or {},
+        "question_ids": list(paper.questions.values_list("id", flat=True)),
+    }
+    cache.set(key, spec, SPEC_TIMEOUT)
+    return spec
+
+
+def paper_exists(paper_id):
+    return paper_spec(paper_id) is not None
+
+
+def _student_key(paper_id):
+    return f"testpaper:{paper_id}:student"
+
+
+def prerender_student_payload(paper_id):
+    """
+    把 Published 试卷的学生端内容（试卷信息 + QuestionPreviewSerializer，不含 is_correct）
+    渲染成 JSON bytes 存进缓存，记下渲染时的题库/图片版本和试卷版本。
+    试卷不存在或未发布返回 None。
+    """
+    version = _student_version(paper_id)  # 先取版本再查库，渲染期间的改动会让这份缓存作废
+    paper = TestPaper.objects.filter(id=paper_id, status="Published").first()
+    if paper is None:
+        cache.delete(_student_key(paper_id))
+        return None
+    data = dict(TestPaperMetaSerializer(paper).data)
+    data["questions"] = render_questions(list(paper.questions.values_list("id", flat=True)))
+    body = JSONRenderer().render(data)
+    entry = (version, '"%s"' % hashlib.sha1(body).hexdigest(), body)
+    cache.set(_student_key(paper_id), entry, STUDENT_TIMEOUT)
+    return entry
+
+
+def _student_version(paper_id):
+    return content_version(), paper_version(paper_id)
+
+
+def student_payload(paper_id):
+    """
+    返回 (etag, bytes)：缓存里的版本（题库/图片 + 本试卷）仍是最新则直接返回，不查库；
+    否则现渲染一次。试卷不存在或未发布返回 None。
+    """
+    entry = cache.get(_student_key(paper_id))
+    if entry is None or entry[0] != _student_version(paper_id):
+        entry = prerender_student_payload(paper_id)
+        if entry is None:
+            return None
+    return entry[1], entry[2]
+
+
+def forget_paper(paper_id):
+    """
+    试卷或题目列表变了：bump 试卷版本（现在一次、提交后再一次，见 bump_after_commit），
+    其他进程里按旧版本缓存的 spec / 学生端内容随之失效；旧条目顺手删掉。
+    """
+    keys = [_spec_key(paper_id), _student_key(paper_id)]
+    bump_after_commit(_paper_version_name(paper_id))
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,197 @@
+# testpaper/generation.py
+"""
+按 level_config 抽题（TestPaperViewSet.generate 与开考共用）：
+- mode == "count": 恰好抽取 exam_questions 道题；若不足则报错
+- mode == "marks": 恰好抽取总分 == total_marks；若凑不出来则报错
+"""
+import hashlib
+import json
+import random
+
+from django.core.cache import cache
+
+from questions.models import Question
+from questions.serializers import QuestionPreviewSerializer
+from questions.pool import pool_index
+from questions.versions import QUESTION_IMAGES, get_version
+from .subset_sum import solve_exact_marks
+
+PREVIEW_TIMEOUT = 60 * 60
+GENERATE_TIMEOUT = 60 * 60
+
+
+def pick_by_count(pool, count, level_name, rng=random):
+    """返回 pool 中的下标"""
+    if len(pool) < count:
+        raise ValueError(
+            f"[{level_name}] Not enough questions: need {count}, only {len(pool)} available."
+        )
+    # 随机取恰好 count 道
+    return rng.sample(range(len(pool)), count)
+
+
+def pick_by_marks(pool, target, level_name, rng=random):
+    """
+    按分值分桶做有界背包（见 subset_sum），恰好凑出 target 分；
+    桶的组合与桶内的题目都随机抽取。返回 pool 中的下标
+    """
+    picked = solve_exact_marks(pool.marks, target, rng)
+    if picked is None:
+        # 没有恰好等于 target 的组合
+        raise ValueError(
+            f"[{level_name}] Cannot reach exact total marks = {int(target)} with available questions."
+        )
+    return picked
+
+
+def generate_questions(level_config, rng=random, pools=None):
+    """
+    全部在内存索引（questions.pool）上完成，不加载题目行。
+    传入 random.Random(seed) 时结果可复现（索引按 id 排序，顺序稳定）。
+    pools = {level_name: QuestionPool} 可由调用方预先取好（批量出卷时每层只取一次）。
+    返回 (question_ids, summary, errors)：
+    summary = {"Level 1": {"mode": "count", "need": 4, "got": 4}, ...}
+    errors 非空表示有层级抽题失败
+    """
+    config = level_config or {}
+
+    all_selected = []
+    summary = {}
+    errors = []
+
+    # 遍历 level_config 各层级
+    for level_name, rules in config.items():
+        mode = rules.get("mode")
+        pool = pools[level_name] if pools is not None else pool_index.get(level_name)
+
+        if mode == "count":
+            need = int(rules.get("exam_questions") or 0)
+            got_idx = []
+            if need > 0:
+                try:
+                    got_idx = pick_by_count(pool, need, level_name, rng)
+                except ValueError as e:
+                    errors.append(str(e))
+            summary[level_name] = {
+                "mode": "count",
+                "need": need,
+                "got": len(got_idx),
+            }
+            all_selected.extend(pool.ids[i] for i in got_idx)
+
+        elif mode == "marks":
+            need = int(rules.get("total_marks") or 0)
+            got_idx = []
+            if need > 0:
+                try:
+                    got_idx = pick_by_marks(pool, need, level_name, rng)
+                except ValueError as e:
+                    errors.append(str(e))
+            # 统计 got 的总分
+            got_marks = sum(pool.marks[i] for i in got_idx)
+            summary[level_name] = {"mode": "marks", "need": need, "got": got_marks}
+            all_selected.extend(pool.ids[i] for i in got_idx)
+
+        else:
+            # 未配置或 mode 空
+            summary[level_name] = {"mode": None, "need": 0, "got": 0}
+
+    # 去重（跨层理论不会重复，但安全起见）
+    unique_selected = list(dict.fromkeys(all_selected))
+
+    return unique_selected, summary, errors
+
+
+def generate_variants(level_config, count, seed, max_overlap=None, max_tries=50):
+    """
+    批量出卷（纸质考试用）：各层题池只取一次，连续抽 count 份。
+    每份用主 rng 派生的 variant_seed 抽题，把它传给 generate?seed= 可单独复现该份。
+    题组按题池下标记成 int 位图：和已出的某份题目完全相同就换 seed 重抽，保证 count 份互不相同；
+    max_overlap 再限制任意两份之间的共同题数，重叠数 = (a & b).bit_count()。
+    单份最多重抽 max_tries 次。返回 [(variant_seed, question_ids, summary), ...]，失败时抛 ValueError。
+    """
+    config = level_config or {}
+    pools = {level_name: pool_index.get(level_name) for level_name in config}
+    master = random.Random(seed)
+    bit_of = {}
+    variants = []
+    masks = []
+    seen = set()
+
+    while len(variants) < count:
+        for _ in range(max_tries):
+            variant_seed = master.getrandbits(32)
+            question_ids, summary, errors = generate_questions(
+                config, random.Random(variant_seed), pools
+            )
+            if errors:
+                raise ValueError("; ".join(errors))
+            mask = 0
+            for qid in question_ids:
+                mask |= 1 << bit_of.setdefault(qid, len(bit_of))
+            if mask in seen:
+                continue
+            if max_overlap is None or all((mask & other).bit_count() <= max_overlap for other in masks):
+                break
+        else:
+            rule = "are distinct" if max_overlap is None else f"satisfy max_overlap = {max_overlap}"
+            raise ValueError(f"Only {len(variants)} of {count} variants {rule}.")
+        masks.append(mask)
+        seen.add(mask)
+        variants.append((variant_seed, question_ids, summary))
+    return variants
+
+
+def select_question_ids(spec):
+    """
+    开考时为一次作答定下题目（spec 见 testpaper.cache.paper_spec）：
+    有 level_config 则按规则抽题，否则用试卷上固定的题目。返回 (question_ids, errors)
+    """
+    if spec["level_config"]:
+        question_ids, _, errors = generate_questions(spec["level_config"])
+        return question_ids, errors
+    return list(spec["question_ids"]), []
+
+
+def content_version():
+    """学生端题目 JSON 依赖的版本：题目/选项 + 图片"""
+    return f"{get_version()}.{get_version(QUESTION_IMAGES)}"
+
+
+def generation_cache_key(paper, seed):
+    """
+    带 seed 的 generate 响应缓存键：试卷 id + seed + 试卷字段（含 level_config）哈希 + 题库版本。
+    题库版本在任何题目/选项变动时都会 bump，覆盖了题池和题目内容两方面的变化；图片版本覆盖题目配图。
+    """
+    paper_fields = json.dumps({
+        "title": paper.title,
+        "level": paper.level,
+        "category": paper.category,
+        "status": paper.status,
+        "level_config": paper.level_config,
+        "duration_seconds": paper.duration_seconds,
+        "pass_percentage": paper.pass_percentage,
+    }, sort_keys=True)
+    digest = hashlib.sha1(paper_fields.encode()).hexdigest()
+    return f"generate:{paper.id}:{seed}:{digest}:{content_version()}"
+
+
+def render_questions(question_ids):
+    """
+    学生端题目 JSON（QuestionPreviewSerializer，不含 is_correct），按 question_ids 顺序。
+    以“题目 id 列表 + 题库/图片版本”的内容哈希缓存，相同题组只序列化一次。
+    """
+    raw = ",".join(str(i) for i in question_ids)
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    key = f"question_preview:{content_version()}:{digest}"
+    data = cache.get(key)
+    if data is None:
+        qmap = {
+            q.id: q
+            for q in Question.objects.filter(id__in=question_ids)
+            .select_related("image").prefetch_related("choices")
+        }
+        ordered = [qmap[qid] for qid in question_ids if qid in qmap]
+        data = list(QuestionPreviewSerializer(ordered, many=True).data)
+        cache.set(key, data, PREVIEW_TIMEOUT)
+    return data
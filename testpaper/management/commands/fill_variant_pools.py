@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from questions.versions import cache_is_shared
+from testpaper.models import TestPaper
+from testpaper.variants import fill_pool, pool_size_target
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep a pool of pre-generated question variants (ids + rendered preview JSON) "
+        "for every Published TestPaper with a level_config, so exam start can take one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", type=int, default=None,
+            help="Variants to keep per paper (default: EXAM_VARIANT_POOL_SIZE).",
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep refilling every --interval seconds.",
+        )
+        parser.add_argument("--interval", type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # 池子放在本进程的内存里，web worker 永远取不到
+            raise CommandError(
+                "fill_variant_pools needs a cache shared with the web workers "
+                "(Redis, see REDIS_URL), not a process-local one."
+            )
+        size = options["size"] or pool_size_target()
+        while True:
+            produced = 0
+            papers = TestPaper.objects.filter(status="Published").exclude(level_config={})
+            for paper in papers.only("id", "level_config"):
+                produced += fill_pool(paper, size)
+            if options["verbosity"] > 1 or not options["loop"]:
+                self.stdout.write(f"Generated {produced} variants")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from testpaper.totals import refresh_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored question_count / total_marks of every TestPaper "
+        "from one grouped query over the paper-question table, and fix the rows that drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        changed = refresh_totals(batch_size=options["batch_size"])
+        if options["verbosity"] > 1:
+            for paper_id, (count, marks) in sorted(changed.items()):
+                self.stdout.write(f"Paper {paper_id}: {count} questions, {marks} marks")
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(changed)} papers."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0007_question_question_created_id_idx'),
+        ('testpaper', '0003_testpaper_duration_seconds_testpaper_pass_percentage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testpaper',
+            index=models.Index(fields=['-created_at', 'id'], name='testpaper_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:47
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    TestPaper = apps.get_model("testpaper", "TestPaper")
+    rows = (
+        TestPaper.questions.through.objects
+        .values("testpaper_id")
+        .annotate(n=Count("id"), marks=Sum("question__marks"))
+        .order_by()
+    )
+    papers = []
+    for row in rows:
+        papers.append(TestPaper(id=row["testpaper_id"], question_count=row["n"], total_marks=row["marks"] or 0))
+    TestPaper.objects.bulk_update(papers, ["question_count", "total_marks"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0007_question_question_created_id_idx'),
+        ('testpaper', '0004_testpaper_testpaper_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testpaper',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='testpaper',
+            name='total_marks',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='testpaper',
+            index=models.Index(fields=['total_marks', 'id'], name='testpaper_total_marks_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
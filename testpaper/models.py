@@ -27,12 +27,16 @@ class TestPaper(models.Model):
     level_config = models.JSONField(default=dict, blank=True)
     duration_seconds = models.PositiveIntegerField(default=3600)  
     pass_percentage = models.PositiveIntegerField(default=60)     
+    # 冗余存储：题目数和总分，由 testpaper.totals 在题目增删、分值修改时维护
+    question_count = models.PositiveIntegerField(default=0, editable=False)
+    total_marks = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at", "id"], name="testpaper_created_id_idx"),
+            models.Index(fields=["total_marks", "id"], name="testpaper_total_marks_idx"),
+        ]
 
     def __str__(self):
         return self.title
-
-    def total_marks(self):
-        return self.questions.aggregate(models.Sum("marks"))["marks__sum"] or 0
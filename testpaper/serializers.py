@@ -22,4 +22,72 @@ class TestPaperSerializer(serializers.ModelSerializer):
             "level_config",  # ✅ 新增字段
             "duration_seconds",
             "pass_percentage",  # 🆕 新增字段
+            "question_count",  # 只读，冗余存储
+            "total_marks",
+        ]
+
+
+class TestPaperSummaryListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        papers = list(data.all() if hasattr(data, "all") else data)
+        rows = (
+            TestPaper.questions.through.objects
+            .filter(testpaper_id__in=[p.id for p in papers])
+            .values_list("testpaper_id", "question__level")
+            .distinct()
+        )
+        paper_levels = {}
+        for paper_id, level in rows:
+            paper_levels.setdefault(paper_id, []).append(level)
+        self.child.paper_levels = {pid: sorted(levels) for pid, levels in paper_levels.items()}
+        return super().to_representation(papers)
+
+
+class TestPaperListSerializer(serializers.ModelSerializer):
+    """
+    列表页的摘要：题目数、总分、覆盖的难度，不再内嵌每道题。
+    question_count / total_marks 是表上的冗余列（见 testpaper.totals）；
+    levels 由 TestPaperSummaryListSerializer 为整页一次查出。
+    """
+    levels = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TestPaper
+        list_serializer_class = TestPaperSummaryListSerializer
+        fields = [
+            "id",
+            "title",
+            "level",
+            "category",
+            "status",
+            "created_at",
+            "level_config",
+            "duration_seconds",
+            "pass_percentage",
+            "question_count",
+            "total_marks",
+            "levels",
+        ]
+
+    def get_levels(self, obj):
+        paper_levels = getattr(self, "paper_levels", None)
+        if paper_levels is None:
+            return sorted(set(obj.questions.values_list("level", flat=True)))
+        return paper_levels.get(obj.id, [])
+
+
+class TestPaperMetaSerializer(serializers.ModelSerializer):
+    """generate / 学生端用的试卷基本信息（不含题目、出题规则和状态）"""
+
+    class Meta:
+        model = TestPaper
+        fields = [
+            "id",
+            "title",
+            "level",
+            "category",
+            "created_at",
+            "duration_seconds",
+            "pass_percentage",
         ]
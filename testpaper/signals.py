@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from questions.models import Question
+from questions.versions import TEST_PAPERS, bump_after_commit
+from .models import TestPaper
+from .cache import forget_paper, prerender_student_payload
+from .totals import refresh_totals
+
+
+def _prerender_on_commit(paper_id):
+    # 已发布试卷提交后立刻预渲染学生端内容，开考时不用现算
+    transaction.on_commit(lambda: prerender_student_payload(paper_id))
+
+
+@receiver(post_save, sender=TestPaper)
+@receiver(post_delete, sender=TestPaper)
+def forget_changed_paper(sender, instance, **kwargs):
+    forget_paper(instance.id)
+    bump_after_commit(TEST_PAPERS)
+    if kwargs["signal"] is post_save and instance.status == "Published":
+        _prerender_on_commit(instance.id)
+
+
+@receiver(m2m_changed, sender=TestPaper.questions.through)
+def forget_paper_questions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith("post_"):
+        bump_after_commit(TEST_PAPERS)
+    if not reverse:
+        if action.startswith("post_"):
+            changed = refresh_totals([instance.id])
+            if instance.id in changed:
+                instance.question_count, instance.total_marks = changed[instance.id]
+            forget_paper(instance.id)
+            if instance.status == "Published":
+                _prerender_on_commit(instance.id)
+        return
+    # question.test_papers.add/remove/clear(...)：instance 是 Question
+    if action == "pre_clear":
+        # clear 之后就查不到了，先记下受影响的试卷
+        instance._cleared_paper_ids = list(instance.test_papers.values_list("id", flat=True))
+        paper_ids = instance._cleared_paper_ids
+    elif action in ("post_add", "post_remove"):
+        paper_ids = pk_set
+        refresh_totals(paper_ids)
+    elif action == "post_clear":
+        refresh_totals(getattr(instance, "_cleared_paper_ids", []))
+        return
+    else:
+        return
+    for paper_id in paper_ids:
+        forget_paper(paper_id)
+
+
+@receiver(post_save, sender=Question)
+def refresh_paper_totals(sender, instance, created, update_fields=None, **kwargs):
+    # 新题还不在任何试卷里；只改了别的字段时分值不变
+    if created or (update_fields is not None and "marks" not in update_fields):
+        return
+    refresh_totals(instance.test_papers.values_list("id", flat=True))
+
+
+@receiver(pre_delete, sender=Question)
+def remember_question_papers(sender, instance, **kwargs):
+    # 删题会级联删掉中间表行，但不发 m2m_changed
+    instance._deleted_paper_ids = list(instance.test_papers.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Question)
+def refresh_deleted_question_papers(sender, instance, **kwargs):
+    paper_ids = getattr(instance, "_deleted_paper_ids", [])
+    refresh_totals(paper_ids)
+    # 缓存的 paper_spec 里还有这道题，不清掉的话新开考会把已删的 id 冻结进作答
+    for paper_id in paper_ids:
+        forget_paper(paper_id)
@@ -0,0 +1,73 @@
+# testpaper/subset_sum.py
+"""
+按总分精确抽题的子集和引擎（bounded knapsack）。
+
+题目按 marks 分桶：桶 g 有 counts[g] 道分值为 values[g] 的题。
+dp 只在 0..target 的布尔数组上推进，每个桶一次向量化转移：
+    reach_g[s] = 存在 k ∈ [0, counts[g]] 使 reach_{g-1}[s - k * values[g]]
+每一阶段的 reach 数组保留下来充当父指针；回溯时在每个桶的可行 k 里随机选一个，
+再在桶内随机抽 k 道具体的题。复杂度 O(桶数 × target)，与题库大小无关。
+"""
+import random
+
+import numpy as np
+
+
+def _advance(prev, value, count):
+    """一个桶的转移：沿 s ≡ r (mod value) 的链，最近一个可达点距离 ≤ count 即可达"""
+    n = prev.size
+    rows = -(-n // value)
+    padded = np.zeros(rows * value, dtype=bool)
+    padded[:n] = prev
+    grid = padded.reshape(rows, value)  # grid[i, r] = prev[i * value + r]
+    idx = np.arange(rows)[:, None]
+    last = np.maximum.accumulate(np.where(grid, idx, -1), axis=0)
+    return ((last >= 0) & (idx - last <= count)).reshape(-1)[:n]
+
+
+def solve_exact_marks(marks, target, rng=random):
+    """
+    从 marks（每道题的分值）里选一组下标，使分值之和恰好为 target。
+    无解返回 None。rng 可传 random.Random(seed) 以获得可复现的结果。
+    """
+    target = int(target)
+    if target < 0:
+        return None
+    if target == 0:
+        return []
+
+    # 按分值分桶：order 按 marks 排序后，每个桶是其中连续的一段
+    marks = np.asarray(marks, dtype=np.int64)
+    order = np.argsort(marks, kind="stable")
+    bucket_values, starts, counts = np.unique(marks[order], return_index=True, return_counts=True)
+    keep = (bucket_values > 0) & (bucket_values <= target)
+    buckets = {
+        int(v): order[start:start + n]
+        for v, start, n in zip(bucket_values[keep], starts[keep], counts[keep])
+    }
+    if sum(m * len(ix) for m, ix in buckets.items()) < target:
+        return None
+
+    values = sorted(buckets)
+    rng.shuffle(values)
+    stages = [np.zeros(target + 1, dtype=bool)]
+    stages[0][0] = True
+    for value in values:
+        stages.append(_advance(stages[-1], value, len(buckets[value])))
+    if not stages[-1][target]:
+        return None
+
+    picked = []
+    s = target
+    for g in reversed(range(len(values))):
+        value = values[g]
+        pool = buckets[value]
+        ks = np.arange(min(len(pool), s // value) + 1)
+        feasible = np.flatnonzero(stages[g][s - ks * value])
+        k = int(ks[rng.choice(feasible.tolist())])
+        if k:
+            picked.extend(pool[rng.sample(range(len(pool)), k)].tolist())
+        s -= k * value
+
+    rng.shuffle(picked)
+    return picked
@@ -1,3 +1,446 @@
-from django.test import TestCase
+import io
+import json
+import random
+import time
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .generation import generate_questions
+from .models import TestPaper
+from . import variants
+from .variants import fill_pool, take_variant
+from .subset_sum import solve_exact_marks
+from questions.models import Choice, Question
+from questions.pool import pool_index
+
+
+class SubsetSumTests(SimpleTestCase):
+
+    def test_exact_and_randomized(self):
+        marks = [1, 2, 2, 3, 5, 5, 8]
+        seen = set()
+        for seed in range(30):
+            picked = solve_exact_marks(marks, 10, random.Random(seed))
+            self.assertEqual(sum(marks[i] for i in picked), 10)
+            self.assertEqual(len(picked), len(set(picked)))
+            seen.add(frozenset(picked))
+        self.assertGreater(len(seen), 1)
+
+    def test_respects_bucket_counts(self):
+        self.assertIsNone(solve_exact_marks([4, 4], 12))
+        self.assertIsNone(solve_exact_marks([3, 6, 9], 7))
+        self.assertEqual(sorted(solve_exact_marks([4, 4, 4], 12)), [0, 1, 2])
+        self.assertEqual(solve_exact_marks([5], 0), [])
+
+    def test_large_pool(self):
+        rng = random.Random(0)
+        marks = [rng.randint(1, 10) for _ in range(100_000)]
+        t0 = time.perf_counter()
+        picked = solve_exact_marks(marks, 250, rng)
+        elapsed = time.perf_counter() - t0
+        self.assertEqual(sum(marks[i] for i in picked), 250)
+        self.assertLess(elapsed, 1.0)
+
+
+class PoolIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.questions = [
+            Question.objects.create(
+                name=f"Q{i}", type="Single Choice", level="Level 1",
+                category="Grammar" if i % 2 else "Vocabulary", marks=i % 3 + 1,
+                question_text=f"Question {i}",
+            )
+            for i in range(12)
+        ]
+
+    def test_generation_runs_in_memory(self):
+        config = {"Level 1": {"mode": "count", "exam_questions": 4},
+                  "Level 2": {"mode": "marks", "total_marks": 0}}
+        generate_questions(config)  # 预热索引
+
+        with self.assertNumQueries(0):
+            ids, summary, errors = generate_questions(config)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(summary["Level 1"]["got"], 4)
+
+        with self.assertNumQueries(0):
+            ids, summary, errors = generate_questions({"Level 1": {"mode": "marks", "total_marks": 9}})
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(Question.objects.get(id=i).marks for i in ids), 9)
+
+    def test_index_follows_question_changes(self):
+        self.assertEqual(len(pool_index.get("Level 1", "Grammar")), 6)
+        self.questions[0].category = "Grammar"
+        self.questions[0].save()
+        self.questions[1].delete()
+        self.assertEqual(len(pool_index.get("Level 1", "Grammar")), 6)
+        self.assertEqual(len(pool_index.get("Level 1")), 11)
+        self.assertEqual(len(pool_index.get("Level 4")), 0)
+
+
+class VariantPoolTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(6):
+            Question.objects.create(
+                name=f"Q{i}", type="Single Choice", level="Level 1", category="Grammar",
+                marks=1, question_text=f"Question {i}",
+            )
+        self.paper = TestPaper.objects.create(
+            title="P", status="Published",
+            level_config={"Level 1": {"mode": "count", "exam_questions": 3}},
+        )
+
+    def start(self, student_no):
+        return self.client.post("/exam/start/", {
+            "paper_id": self.paper.id, "student": {"student_no": student_no, "name": "A"},
+        }, content_type="application/json")
+
+    def test_start_takes_pre_generated_variants(self):
+        self.assertEqual(fill_pool(self.paper, size=2), 2)
+        self.assertEqual(fill_pool(self.paper, size=2), 0)
+        self.start("warm")  # 预热试卷 spec 缓存，消耗一份
+
+        with self.assertNumQueries(3):  # upsert 学生 + 取学生 id + insert attempt
+            resp = self.start("S1")
+        self.assertEqual(len(resp.json()["questions"]), 3)
+
+        # 池子空了，回退到现场抽题
+        self.assertEqual(len(self.start("S2").json()["questions"]), 3)
+        self.assertEqual(fill_pool(self.paper, size=2), 2)
+
+    def test_command_refuses_a_process_local_cache(self):
+        call_command("fill_variant_pools", size=1, stdout=io.StringIO())
+        self.assertIsNotNone(take_variant(self.paper.id, self.paper.level_config))
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            with self.assertRaises(CommandError):
+                call_command("fill_variant_pools", size=1, stdout=io.StringIO())
+
+    def test_each_slot_is_claimed_once(self):
+        fill_pool(self.paper, size=3)
+        config = self.paper.level_config
+        prefix = variants._pool_prefix(self.paper.id, config)
+        first = take_variant(self.paper.id, config)
+        # 数据库缓存上并发的 incr 可能丢更新：tail 退回去，已认领的编号要跳过
+        cache.set(f"{prefix}:tail", 0)
+        second, third = take_variant(self.paper.id, config), take_variant(self.paper.id, config)
+        self.assertNotIn(None, (first, second, third))
+        self.assertIsNone(take_variant(self.paper.id, config))
+
+        # head/tail 都被逐出后重新编号，新槽位不受旧 claim 键影响
+        cache.delete_many([f"{prefix}:head", f"{prefix}:tail"])
+        self.assertEqual(fill_pool(self.paper, size=1), 1)
+        self.assertIsNotNone(take_variant(self.paper.id, config))
+
+    def test_question_change_invalidates_pool(self):
+        fill_pool(self.paper, size=2)
+        Question.objects.first().save()
+        self.assertIsNone(take_variant(self.paper.id, self.paper.level_config))
+
+
+class SeededGenerateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(20):
+            Question.objects.create(
+                name=f"Q{i}", type="Single Choice", level="Level 1", category="Grammar",
+                marks=i % 4 + 1, question_text=f"Question {i}",
+            )
+        self.paper = TestPaper.objects.create(
+            title="P",
+            level_config={"Level 1": {"mode": "marks", "total_marks": 12}},
+        )
+        self.url = f"/test-papers/{self.paper.id}/generate/"
+
+    def ids(self, resp):
+        self.assertEqual(resp.status_code, 200)
+        return [q["id"] for q in resp.json()["generated_questions"]]
+
+    def test_same_seed_same_paper(self):
+        first = self.ids(self.client.get(self.url, {"seed": 7}))
+        cache.clear()  # 不走响应缓存，重新抽也应一致
+        self.assertEqual(self.ids(self.client.get(self.url, {"seed": 7})), first)
+        others = {tuple(self.ids(self.client.get(self.url, {"seed": s}))) for s in range(8)}
+        self.assertGreater(len(others), 1)
+
+    def test_seeded_response_is_cached(self):
+        first = self.client.get(self.url, {"seed": 3}).json()
+        with self.assertNumQueries(1):  # 只剩 get_object
+            self.assertEqual(self.client.get(self.url, {"seed": 3}).json(), first)
+
+        # 改题目或试卷都会换缓存键
+        q = Question.objects.get(id=first["generated_questions"][0]["id"])
+        q.question_text = "Edited"
+        q.save()
+        regenerated = self.client.get(self.url, {"seed": 3}).json()
+        self.assertEqual(regenerated["generated_questions"][0]["question_text"], "Edited")
+        self.paper.title = "P2"
+        self.paper.save()
+        self.assertEqual(self.client.get(self.url, {"seed": 3}).json()["title"], "P2")
+
+    def test_unseeded_returns_reusable_seed(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(self.ids(self.client.get(self.url, {"seed": data["seed"]})),
+                         [q["id"] for q in data["generated_questions"]])
+        self.assertEqual(self.client.get(self.url, {"seed": "x"}).status_code, 400)
+
+
+class BatchGenerateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(40):
+            Question.objects.create(
+                name=f"Q{i}", type="Single Choice", level="Level 1", category="Grammar",
+                marks=i % 3 + 1, question_text=f"Question {i}",
+            )
+        self.paper = TestPaper.objects.create(
+            title="P",
+            level_config={"Level 1": {"mode": "count", "exam_questions": 5}},
+        )
+        self.url = f"/test-papers/{self.paper.id}/generate-batch/"
+
+    def lines(self, resp):
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+
+    def test_streams_variants(self):
+        header, *variants = self.lines(self.client.get(self.url, {"count": 20, "seed": 1}))
+        self.assertEqual(header["paper"]["id"], self.paper.id)
+        self.assertEqual(len(variants), 20)
+        for v in variants:
+            self.assertEqual(len(v["question_ids"]), 5)
+            self.assertEqual([q["id"] for q in v["questions"]], v["question_ids"])
+
+        # 每份的 seed 可以交给 generate 单独复现
+        single = self.client.get(f"/test-papers/{self.paper.id}/generate/",
+                                 {"seed": variants[3]["seed"]}).json()
+        self.assertEqual([q["id"] for q in single["generated_questions"]],
+                         variants[3]["question_ids"])
+
+    def test_max_overlap(self):
+        _, *variants = self.lines(self.client.get(
+            self.url, {"count": 8, "seed": 2, "max_overlap": 1}))
+        sets = [set(v["question_ids"]) for v in variants]
+        for i, a in enumerate(sets):
+            for b in sets[i + 1:]:
+                self.assertLessEqual(len(a & b), 1)
+
+        # 40 题里凑不出 20 份两两不重叠的 5 题卷
+        resp = self.client.get(self.url, {"count": 20, "max_overlap": 0})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"count": 0}).status_code, 400)
+
+    def test_variants_are_distinct(self):
+        # 40 选 1 只有 40 种卷子，随手抽 20 份几乎必然撞车，要靠重抽去重
+        self.paper.level_config = {"Level 1": {"mode": "count", "exam_questions": 1}}
+        self.paper.save()
+        _, *variants = self.lines(self.client.get(self.url, {"count": 20, "seed": 1}))
+        self.assertEqual(len({v["question_ids"][0] for v in variants}), 20)
+        self.assertEqual(self.client.get(self.url, {"count": 41, "seed": 1}).status_code, 400)
+
+
+class PaperListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def make_paper(self, title, n):
+        questions = Question.objects.bulk_create([
+            Question(name=f"{title}-{i}", type="Single Choice", level=f"Level {i % 2 + 1}",
+                     category="Grammar", marks=i + 1, question_text="T")
+            for i in range(n)
+        ])
+        Choice.objects.bulk_create([Choice(question=q, text="a", is_correct=True) for q in questions])
+        paper = TestPaper.objects.create(title=title)
+        paper.questions.set(questions)
+        return paper
+
+    def test_list_is_a_summary_in_constant_queries(self):
+        self.make_paper("small", 2)
+        with self.assertNumQueries(3):  # count + 当前页 + 整页的 levels
+            rows = self.client.get("/test-papers/").json()["results"]
+        self.make_paper("big", 30)
+        TestPaper.objects.create(title="empty")
+        with self.assertNumQueries(3):
+            rows = {r["title"]: r for r in self.client.get("/test-papers/").json()["results"]}
+        self.assertNotIn("questions_detail", rows["big"])
+        self.assertEqual((rows["big"]["question_count"], rows["big"]["total_marks"]), (30, 465))
+        self.assertEqual(rows["big"]["levels"], ["Level 1", "Level 2"])
+        self.assertEqual((rows["empty"]["question_count"], rows["empty"]["total_marks"], rows["empty"]["levels"]),
+                         (0, 0, []))
+
+    def test_retrieve_queries_do_not_grow_with_questions(self):
+        small, big = self.make_paper("small", 2), self.make_paper("big", 30)
+        # 试卷 + 题目(含 stat/image) + choices
+        with self.assertNumQueries(3):
+            self.client.get(f"/test-papers/{small.id}/")
+        with self.assertNumQueries(3):
+            data = self.client.get(f"/test-papers/{big.id}/").json()
+        self.assertEqual(len(data["questions_detail"]), 30)
+        self.assertEqual(len(data["questions_detail"][0]["choices"]), 1)
+
+    def test_update_response_queries_do_not_grow_with_questions(self):
+        small, big = self.make_paper("small", 2), self.make_paper("big", 30)
+
+        def update_queries(paper):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.patch(f"/test-papers/{paper.id}/", {"title": "renamed"},
+                                         content_type="application/json")
+            self.assertEqual(len(resp.json()["questions_detail"]), paper.question_count)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(update_queries(small), update_queries(big))
+
+
+class PaperTotalsTests(TestCase):
+
+    def setUp(self):
+        self.questions = Question.objects.bulk_create([
+            Question(name=f"Q{i}", type="Single Choice", level="Level 1",
+                     category="Grammar", marks=i + 1, question_text="T")
+            for i in range(4)
+        ])  # marks 1..4
+        self.paper = TestPaper.objects.create(title="P")
+
+    def totals(self, paper):
+        paper = TestPaper.objects.get(id=paper.id)
+        return paper.question_count, paper.total_marks
+
+    def test_forward_changes(self):
+        q1, q2, q3, q4 = self.questions
+        self.paper.questions.set([q1, q2, q3])
+        self.assertEqual(self.totals(self.paper), (3, 6))
+        self.assertEqual((self.paper.question_count, self.paper.total_marks), (3, 6))
+        self.paper.questions.remove(q1)
+        self.paper.questions.add(q4)
+        self.assertEqual(self.totals(self.paper), (3, 9))
+        self.paper.questions.clear()
+        self.assertEqual(self.totals(self.paper), (0, 0))
+
+    def test_reverse_changes_marks_and_delete(self):
+        q1, q2, q3, q4 = self.questions
+        other = TestPaper.objects.create(title="O")
+        q4.test_papers.add(self.paper, other)
+        q3.test_papers.add(self.paper)
+        self.assertEqual((self.totals(self.paper), self.totals(other)), ((2, 7), (1, 4)))
+
+        q4.marks = 10
+        q4.save()
+        self.assertEqual((self.totals(self.paper), self.totals(other)), ((2, 13), (1, 10)))
+        q4.name = "renamed"
+        with CaptureQueriesContext(connection) as ctx:  # 只改名：不重算试卷汇总
+            q4.save(update_fields=["name"])
+        self.assertFalse([q for q in ctx.captured_queries if "testpaper" in q["sql"]])
+
+        q4.test_papers.clear()
+        self.assertEqual((self.totals(self.paper), self.totals(other)), ((1, 3), (0, 0)))
+        q3.delete()
+        self.assertEqual(self.totals(self.paper), (0, 0))
+
+    def test_filter_and_order_by_stored_totals(self):
+        q1, q2, q3, q4 = self.questions
+        self.paper.questions.set([q1])
+        TestPaper.objects.create(title="big").questions.set([q2, q3, q4])
+        TestPaper.objects.create(title="empty")
+        rows = self.client.get("/test-papers/?ordering=-total_marks,id").json()["results"]
+        self.assertEqual([r["title"] for r in rows], ["big", "P", "empty"])
+        rows = self.client.get("/test-papers/?total_marks__gte=1&question_count__lte=2").json()["results"]
+        self.assertEqual([r["title"] for r in rows], ["P"])
+        self.assertEqual(self.client.get(f"/test-papers/{self.paper.id}/").json()["total_marks"], 1)
+
+    def test_repair_command(self):
+        self.paper.questions.set(self.questions)
+        empty = TestPaper.objects.create(title="empty")
+        TestPaper.objects.filter(id=self.paper.id).update(question_count=0, total_marks=99)
+        TestPaper.objects.filter(id=empty.id).update(total_marks=5)
+        with self.assertNumQueries(3):  # 分组统计 + 读取试卷 + 批量写回
+            call_command("repair_paper_totals", stdout=io.StringIO())
+        self.assertEqual((self.totals(self.paper), self.totals(empty)), ((4, 10), (0, 0)))
+
+    def test_repair_invalidates_list_etag(self):
+        self.paper.questions.set(self.questions)
+        TestPaper.objects.filter(id=self.paper.id).update(total_marks=99)
+        stale = self.client.get("/test-papers/")
+        self.assertEqual(stale.json()["results"][0]["total_marks"], 99)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("repair_paper_totals", stdout=io.StringIO())
+        fresh = self.client.get("/test-papers/", HTTP_IF_NONE_MATCH=stale["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()["results"][0]["total_marks"], 10)
+
+        etag = fresh["ETag"]
+        call_command("repair_paper_totals", stdout=io.StringIO())  # 没有改写：不 bump
+        self.assertEqual(self.client.get("/test-papers/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class StudentPayloadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.questions = Question.objects.bulk_create([
+            Question(name=f"Q{i}", type="Single Choice", level="Level 1",
+                     category="Grammar", marks=2, question_text=f"Question {i}")
+            for i in range(3)
+        ])
+        Choice.objects.bulk_create([
+            Choice(question=q, text=text, is_correct=text == "right")
+            for q in self.questions for text in ("wrong", "right")
+        ])
+        self.paper = TestPaper.objects.create(title="P")
+        self.paper.questions.set(self.questions)
+        self.url = f"/test-papers/{self.paper.id}/student/"
+
+    def publish(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paper.status = "Published"
+            self.paper.save()
+
+    def test_prerendered_on_publish_and_served_without_orm(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)  # Draft
+        self.publish()
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        data = resp.json()
+        self.assertEqual(data["title"], "P")
+        self.assertEqual(len(data["questions"]), 3)
+        self.assertNotIn("is_correct", resp.content.decode())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+    def test_invalidated_by_question_and_paper_changes(self):
+        self.publish()
+        choice = Choice.objects.filter(question=self.questions[0], text="wrong").get()
+        choice.text = "edited"
+        choice.save()
+        self.assertIn("edited", self.client.get(self.url).content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paper.questions.remove(self.questions[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(self.url).json()["questions"]), 2)
+
+        self.paper.status = "Draft"
+        self.paper.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_entry_cached_before_a_change_is_not_served(self):
+        self.publish()
+        key = f"testpaper:{self.paper.id}:student"
+        stale = cache.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paper.questions.remove(self.questions[0])
+        # 另一个 worker 在改动提交前按旧题目列表写回的缓存
+        cache.set(key, stale)
+        self.assertEqual(len(self.client.get(self.url).json()["questions"]), 2)
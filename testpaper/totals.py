@@ -0,0 +1,58 @@
+"""
+试卷的冗余汇总列：TestPaper.question_count / TestPaper.total_marks。
+
+两列都由中间表上的一条 GROUP BY 算出（paper_totals），再用 bulk_update 写回
+变化了的行（refresh_totals）。signals 在以下时机调用 refresh_totals：
+- TestPaper.questions 的 m2m_changed（正向和反向）
+- Question 保存（分值可能变了）和删除（级联删掉中间表行，不发 m2m_changed）
+
+批量导入只新建题目，不会进任何试卷，不影响汇总。
+数据不一致时用 ``manage.py repair_paper_totals`` 全量重算。
+
+bulk_update 不发 post_save，列表的 ETag 不会跟着变，所以有改写时这里自己 bump
+TEST_PAPERS。
+"""
+from django.db.models import Count, Sum
+
+from questions.versions import TEST_PAPERS, bump_after_commit
+from .models import TestPaper
+
+
+def paper_totals(paper_ids=None):
+    """{paper_id: (question_count, total_marks)}；没有题目的试卷不在结果里"""
+    rows = TestPaper.questions.through.objects.all()
+    if paper_ids is not None:
+        rows = rows.filter(testpaper_id__in=paper_ids)
+    rows = (
+        rows.values("testpaper_id")
+        .annotate(n=Count("id"), marks=Sum("question__marks"))
+        .order_by()
+    )
+    return {row["testpaper_id"]: (row["n"], row["marks"] or 0) for row in rows}
+
+
+def refresh_totals(paper_ids=None, batch_size=500):
+    """
+    重算并写回（paper_ids=None 表示全部试卷）。
+    用 bulk_update，不触发 post_save（有改写时自己 bump TEST_PAPERS）；返回 {paper_id: (question_count, total_marks)}
+    中实际被改写的那些。
+    """
+    if paper_ids is not None:
+        paper_ids = list(paper_ids)
+        if not paper_ids:
+            return {}
+    totals = paper_totals(paper_ids)
+    papers = TestPaper.objects.only("id", "question_count", "total_marks").order_by()
+    if paper_ids is not None:
+        papers = papers.filter(id__in=paper_ids)
+
+    changed = []
+    for paper in papers.iterator(chunk_size=2000):
+        count, marks = totals.get(paper.id, (0, 0))
+        if (paper.question_count, paper.total_marks) != (count, marks):
+            paper.question_count, paper.total_marks = count, marks
+            changed.append(paper)
+    if changed:
+        TestPaper.objects.bulk_update(changed, ["question_count", "total_marks"], batch_size=batch_size)
+        bump_after_commit(TEST_PAPERS)
+    return {paper.id: (paper.question_count, paper.total_marks) for paper in changed}
@@ -0,0 +1,81 @@
+# testpaper/variants.py
+"""
+已发布试卷的预生成题组池：开考高峰时直接取一份，不在请求里现抽题。
+
+每份 variant = {"question_ids": [...], "questions": 预渲染的学生端题目 JSON}，
+存放在 Django cache 的编号槽位里：
+    head = 已生产到的编号（fill_variant_pools 负责补货）
+    tail = 已消费到的编号（开考时 incr，O(1) 取走一份）
+    slot:{n}:claimed = 槽位 n 已被认领（cache.add 写入，同一槽位只有一个请求能拿到）
+缓存键带题库/图片版本号与 level_config 哈希，题目或出题规则一变，旧池自动失效。
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .generation import content_version, generate_questions, render_questions
+
+VARIANT_TIMEOUT = 24 * 60 * 60
+CLAIM_TRIES = 3
+
+
+def pool_size_target():
+    return getattr(settings, "EXAM_VARIANT_POOL_SIZE", 50)
+
+
+def _pool_prefix(paper_id, level_config):
+    config_hash = hashlib.sha1(
+        json.dumps(level_config, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return f"variants:{paper_id}:{content_version()}:{config_hash}"
+
+
+def take_variant(paper_id, level_config):
+    """
+    取走一份预生成的题组；池子空了返回 None（调用方现场抽题）。
+    incr 只在 Redis 上是原子的，数据库缓存上是读-改-写，并发时两个请求可能拿到同一个编号；
+    所以 tail 只负责分配编号，真正认领槽位靠 cache.add 一个 claim 键，认领失败就换下一个编号。
+    """
+    prefix = _pool_prefix(paper_id, level_config)
+    cache.add(f"{prefix}:tail", 0, VARIANT_TIMEOUT)
+    for _ in range(CLAIM_TRIES):
+        try:
+            n = cache.incr(f"{prefix}:tail")
+        except ValueError:
+            return None
+        slot = f"{prefix}:slot:{n}"
+        if not cache.add(f"{slot}:claimed", 1, VARIANT_TIMEOUT):
+            continue
+        variant = cache.get(slot)
+        if variant is not None:
+            cache.delete(slot)
+        return variant
+    return None
+
+
+def fill_pool(paper, size=None):
+    """把一张试卷的池子补到 size 份，返回本次新生成的份数"""
+    size = size or pool_size_target()
+    level_config = paper.level_config or {}
+    prefix = _pool_prefix(paper.id, level_config)
+    tail = cache.get(f"{prefix}:tail", 0)
+    head = max(cache.get(f"{prefix}:head", 0), tail)
+
+    produced = 0
+    while head - tail < size:
+        question_ids, _, errors = generate_questions(level_config)
+        if errors:
+            break
+        head += 1
+        cache.set(f"{prefix}:slot:{head}", {
+            "question_ids": question_ids,
+            "questions": render_questions(question_ids),
+        }, VARIANT_TIMEOUT)
+        # head/tail 被逐出后编号会从头再来，旧的 claim 键不能挡住新槽位
+        cache.delete(f"{prefix}:slot:{head}:claimed")
+        cache.set(f"{prefix}:head", head, VARIANT_TIMEOUT)
+        produced += 1
+        tail = cache.get(f"{prefix}:tail", 0)
+    return produced
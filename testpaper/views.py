@@ -1,17 +1,71 @@
 # testpaper/views.py
+import json
 import random
-from rest_framework import viewsets, status
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import filters, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from questions.etags import VersionETagMixin
+from questions.models import Choice, Question
+from questions.versions import QUESTION_BANK, QUESTION_IMAGES, QUESTION_STATS, TEST_PAPERS
 from .models import TestPaper
-from .serializers import TestPaperSerializer
-from questions.models import Question
-from questions.serializers import QuestionPreviewSerializer  # 你现有的读序列化器
+from .serializers import TestPaperSerializer, TestPaperListSerializer, TestPaperMetaSerializer
+from .generation import generate_questions, render_questions
+from .generation import generation_cache_key, generate_variants, GENERATE_TIMEOUT
+from .cache import student_payload
+
+MAX_BATCH_VARIANTS = 200
 
 
-class TestPaperViewSet(viewsets.ModelViewSet):
+class TestPaperViewSet(VersionETagMixin, viewsets.ModelViewSet):
     queryset = TestPaper.objects.all()
     serializer_class = TestPaperSerializer
+    # questions_detail 内嵌题目（含图片、正确率），题目侧的版本也要算进 ETag
+    etag_versions = (TEST_PAPERS, QUESTION_BANK, QUESTION_IMAGES, QUESTION_STATS)
+    # 题目数、总分是冗余列，可直接过滤/排序：?total_marks__gte=50&ordering=-total_marks,id
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        "status": ["exact"],
+        "question_count": ["exact", "gte", "lte"],
+        "total_marks": ["exact", "gte", "lte"],
+    }
+    ordering_fields = ["created_at", "question_count", "total_marks", "id"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            # 摘要：题目数和总分直接读冗余列，不再 JOIN 聚合
+            return queryset.order_by("-created_at", "id")
+        if self.action == "retrieve":
+            return self._with_questions_detail(queryset)
+        return queryset
+
+    @staticmethod
+    def _with_questions_detail(queryset):
+        # 完整详情：题目、选项、图片、统计各一条查询，与题目数量无关
+        return queryset.prefetch_related(Prefetch(
+            "questions",
+            queryset=Question.objects.select_related("stat", "image").prefetch_related(
+                Prefetch("choices", queryset=Choice.objects.order_by("id"))
+            ),
+        ))
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # DRF 保存后会清掉预取缓存；改完重新按详情查询取一次，响应不再逐题查库
+        serializer.instance = self._with_questions_detail(TestPaper.objects.all()).get(
+            pk=serializer.instance.pk
+        )
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return TestPaperListSerializer
+        return super().get_serializer_class()
 
     @action(detail=True, methods=["get"])
     def generate(self, request, pk=None):
@@ -31,86 +85,27 @@ class TestPaperViewSet(viewsets.ModelViewSet):
         }
         """
         paper = self.get_object()
-        config = paper.level_config or {}
 
-        all_selected = []
-        summary = {}
-        errors = []
-
-        def pick_by_count(qs, count, level_name):
-            pool = list(qs)
-            if len(pool) < count:
-                raise ValueError(
-                    f"[{level_name}] Not enough questions: need {count}, only {len(pool)} available."
+        # ?seed=<int>：结果可复现，整份响应按 (试卷, seed, 配置, 题库版本) 缓存
+        seed_param = request.query_params.get("seed")
+        if seed_param is not None:
+            try:
+                seed = int(seed_param)
+            except ValueError:
+                return Response(
+                    {"detail": "seed must be an integer"},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            # 随机取恰好 count 道
-            return random.sample(pool, count)
-
-        def pick_by_marks(qs, target, level_name):
-            """
-            子集和DP：恰好等于 target
-            dp[score] = 使用到的下标列表
-            为了随机化，先洗牌
-            """
-            pool = list(qs)
-            random.shuffle(pool)
-            target = int(target)
-
-            dp = {0: []}  # 分数 -> 使用的索引列表
-            for idx, q in enumerate(pool):
-                m = int(q.marks)
-                # 遍历快照，避免一轮多次复用同一题
-                for cur, used_idx in list(dp.items()):
-                    new_sum = cur + m
-                    if new_sum > target:
-                        continue
-                    if new_sum not in dp:  # 首次到达该分数
-                        dp[new_sum] = used_idx + [idx]
-                        if new_sum == target:
-                            # 立即返回一组解
-                            return [pool[i] for i in dp[new_sum]]
-
-            # 没有恰好等于 target 的组合
-            raise ValueError(
-                f"[{level_name}] Cannot reach exact total marks = {target} with available questions."
-            )
+            cache_key = generation_cache_key(paper, seed)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return Response(cached, status=status.HTTP_200_OK)
+        else:
+            seed = random.getrandbits(32)
 
-        # 遍历 level_config 各层级
-        for level_name, rules in config.items():
-            mode = rules.get("mode")
-            level_qs = Question.objects.filter(level=level_name)
-
-            if mode == "count":
-                need = int(rules.get("exam_questions") or 0)
-                got_list = []
-                if need > 0:
-                    try:
-                        got_list = pick_by_count(level_qs, need, level_name)
-                    except ValueError as e:
-                        errors.append(str(e))
-                summary[level_name] = {
-                    "mode": "count",
-                    "need": need,
-                    "got": len(got_list),
-                }
-                all_selected.extend(got_list)
-
-            elif mode == "marks":
-                need = int(rules.get("total_marks") or 0)
-                got_list = []
-                if need > 0:
-                    try:
-                        got_list = pick_by_marks(level_qs, need, level_name)
-                    except ValueError as e:
-                        errors.append(str(e))
-                # 统计 got 的总分
-                got_marks = sum(q.marks for q in got_list)
-                summary[level_name] = {"mode": "marks", "need": need, "got": got_marks}
-                all_selected.extend(got_list)
-
-            else:
-                # 未配置或 mode 空
-                summary[level_name] = {"mode": None, "need": 0, "got": 0}
+        question_ids, summary, errors = generate_questions(
+            paper.level_config, random.Random(seed)
+        )
 
         # 如果有任何层级失败，返回 400 和错误信息
         if errors:
@@ -119,20 +114,88 @@ class TestPaperViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # 去重（跨层理论不会重复，但安全起见）
-        seen = set()
-        unique_selected = []
-        for q in all_selected:
-            if q.id not in seen:
-                unique_selected.append(q)
-                seen.add(q.id)
-
-        # 序列化返回（不保存）
-        paper_data = TestPaperSerializer(paper).data
-        paper_data["generated_questions"] = QuestionPreviewSerializer(
-            unique_selected, many=True
-        ).data
-        for key in ["level_config", "questions", "questions_detail", "status"]:
-            paper_data.pop(key, None)
-            
+        # 序列化返回（不保存）；只按选中的 id 取题
+        paper_data = TestPaperMetaSerializer(paper).data
+        paper_data["generated_questions"] = render_questions(question_ids)
+        # 返回本次用的 seed，带上它再请求即可复现同一份题
+        paper_data["seed"] = seed
+
+        if seed_param is not None:
+            cache.set(cache_key, dict(paper_data), GENERATE_TIMEOUT)
         return Response(paper_data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["get"], url_path="generate-batch")
+    def generate_batch(self, request, pk=None):
+        """
+        纸质考试批量出卷：?count=N（1..200）&seed=S&max_overlap=K
+        以 NDJSON 流式返回：第一行是试卷信息，之后每行一份：
+        {"variant": 1, "seed": ..., "question_ids": [...], "summary": {...}, "questions": [...]}
+        全部题组先在内存里抽完，再一次性渲染所有用到的题目，逐行写出。
+        """
+        paper = self.get_object()
+        try:
+            count = int(request.query_params.get("count", ""))
+            seed = request.query_params.get("seed")
+            seed = int(seed) if seed is not None else random.getrandbits(32)
+            max_overlap = request.query_params.get("max_overlap")
+            max_overlap = int(max_overlap) if max_overlap is not None else None
+        except ValueError:
+            return Response(
+                {"detail": "count, seed and max_overlap must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= count <= MAX_BATCH_VARIANTS or (max_overlap is not None and max_overlap < 0):
+            return Response(
+                {"detail": f"count must be 1..{MAX_BATCH_VARIANTS}, max_overlap must be >= 0"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            variants = generate_variants(paper.level_config, count, seed, max_overlap)
+        except ValueError as e:
+            return Response(
+                {"detail": "Generate failed", "errors": [str(e)]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # 所有份用到的题目只渲染一次
+        used_ids = sorted({qid for _, ids, _ in variants for qid in ids})
+        rendered = {q["id"]: q for q in render_questions(used_ids)}
+
+        paper_data = TestPaperMetaSerializer(paper).data
+
+        def lines():
+            yield json.dumps({"paper": paper_data, "count": count, "seed": seed}) + "\n"
+            for n, (variant_seed, ids, summary) in enumerate(variants, 1):
+                yield json.dumps({
+                    "variant": n,
+                    "seed": variant_seed,
+                    "question_ids": ids,
+                    "summary": summary,
+                    "questions": [rendered[qid] for qid in ids if qid in rendered],
+                }) + "\n"
+
+        return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+    @action(detail=True, methods=["get"])
+    def student(self, request, pk=None):
+        """
+        学生端试卷内容（Published 才有）：发布时预渲染好的 JSON bytes，
+        命中缓存时不查库、不走 serializer；支持 If-None-Match。
+        """
+        try:
+            paper_id = int(pk)
+        except ValueError:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        payload = student_payload(paper_id)
+        if payload is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        etag, body = payload
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        return response